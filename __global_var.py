@@ -5,15 +5,35 @@ This file holds global variables used in multiple files of the program
 
 
 from pyA20.gpio import port
-from .util import lcd_driver
+from .util.station import Station
+from .common.api import ApiClient
+from .common.cache import TTLCache
+from .common.journal import Journal
+from .common.allowlist import Allowlist
+from .common.prober import Prober
+from .common import config
 
 
-lcd = lcd_driver.LCD_Driver()
+# Pins are given by name in config.stations
 
-#left_button = port.PA20
-#middle_button = port.PA14
-#right_button = port.PA10
+stations = [
+    Station(name, serial_port, lcd_address, *(getattr(port, pin) for pin in pins))
+    for name, serial_port, lcd_address, *pins in config.stations
+]
 
-left_button = port.PA16
-middle_button = port.PA14
-right_button = port.PA15
+# Every station can have a tag being processed, each needing up to three calls at once
+
+api = ApiClient(pool_size = config.api_pool_size * len(stations))
+tags = TTLCache(config.tag_cache_size, config.tag_cache_ttl, config.tag_cache_file, config.tag_cache_save_delay)   # Tag ID -> owner attributes
+journal = Journal(config.journal_file, api)
+allowlist = Allowlist(config.allowlist_file, api)
+prober = Prober(api)
+
+# Hardware of the first station
+
+lcd = stations[0].lcd
+buttons = stations[0].buttons
+
+left_button = stations[0].left_button
+middle_button = stations[0].middle_button
+right_button = stations[0].right_button
@@ -4,18 +4,8 @@ from pyA20.gpio import connector
 import Spalek.__global_var as G
 
 
-# Setup buttons
-
 gpio.init()
 
-gpio.setcfg(G.left_button, gpio.INPUT)
-gpio.setcfg(G.middle_button, gpio.INPUT)
-gpio.setcfg(G.right_button, gpio.INPUT)
-
-gpio.pullup(G.left_button, gpio.PULLUP)
-gpio.pullup(G.middle_button, gpio.PULLUP)
-gpio.pullup(G.right_button, gpio.PULLUP)
-
 # Create and load oad custom font
 
 fontdata1 = [
@@ -26,7 +16,12 @@ fontdata1 = [
         # Down
         [ 0x00, 0x00, 0x00, 0x1F, 0x0E, 0x04, 0x00, 0x00 ],
         # Up
-        [ 0x00, 0x00, 0x04, 0x0E, 0x1F, 0x00, 0x00, 0x00 ]
+        [ 0x00, 0x00, 0x04, 0x0E, 0x1F, 0x00, 0x00, 0x00 ],
+        # Offline, a crossed out link
+        [ 0x11, 0x0A, 0x04, 0x0A, 0x11, 0x00, 0x1F, 0x00 ]
 ]
 
-G.lcd.LoadCustom(fontdata1)
+# Setup the buttons and displays of every station
+
+for station in G.stations:
+    station.start(fontdata1)
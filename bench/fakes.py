@@ -0,0 +1,195 @@
+"""
+In-process stand-ins for the hardware libraries: smbus, pyserial and pyA20
+
+install() registers them in sys.modules, so it has to be called before
+anything from the package is imported
+
+"""
+
+
+from types import ModuleType
+import sys, os, fcntl, termios, array, time, threading, select
+
+
+class FakeSMBus(object):
+    """
+    SMBus that counts the I2C transactions and bytes instead of talking to a device
+
+    """
+
+    transactions = 0
+    bytes = 0
+
+
+    def __init__(self, bus = 0):
+        self.bus = bus
+
+
+    def write_byte(self, addr, value):
+        FakeSMBus.transactions += 1
+        FakeSMBus.bytes += 1
+
+
+    def write_i2c_block_data(self, addr, cmd, data):
+        FakeSMBus.transactions += 1
+        FakeSMBus.bytes += 1 + len(data)
+
+
+    @classmethod
+    def reset(cls):
+        cls.transactions = 0
+        cls.bytes = 0
+
+
+class FakeSerial(object):
+    """
+    Serial port backed by a pipe: data fed by the benchmark is read back by the tag reader,
+    and the read end can be waited on like a real tty
+
+    The last port opened for each name is kept in FakeSerial.ports; data fed once
+    it is closed is lost, like frames sent while no reader is open
+
+    """
+
+    ports = {}
+
+
+    def __init__(self, port = None, baudrate = 9600, bytesize = 8, timeout = None):
+        self.port = port
+        self.timeout = timeout
+        self.__r, self.__w = os.pipe()
+        os.set_blocking(self.__r, False)
+
+        self.__open = True
+        self.__lock = threading.Lock()
+
+        FakeSerial.ports[port] = self
+
+
+    def feed(self, data):
+        with self.__lock:
+            if self.__open:
+                os.write(self.__w, data)
+
+
+    def fileno(self):
+        return self.__r
+
+
+    @property
+    def in_waiting(self):
+        waiting = array.array("i", [0])
+        fcntl.ioctl(self.__r, termios.FIONREAD, waiting)
+
+        return waiting[0]
+
+
+    def read(self, size = 1):
+        """
+        Waits up to the timeout for data, like pyserial, then returns what is there (at most size bytes)
+
+        """
+
+        select.select([self.__r], [], [], self.timeout)
+
+        try:
+            return os.read(self.__r, size)
+        except BlockingIOError:
+            return b""
+
+
+    def reset_input_buffer(self):
+        try:
+            while os.read(self.__r, 4096):
+                pass
+        except BlockingIOError:
+            pass
+
+
+    def isOpen(self):
+        return self.__open
+
+
+    def close(self):
+        with self.__lock:
+            if self.__open:
+                self.__open = False
+
+                os.close(self.__r)
+                os.close(self.__w)
+
+
+class FakeGPIO(object):
+    """
+    pyA20 gpio module; the buttons are pulled up, so pins read 1 unless pressed
+
+    """
+
+    INPUT = 0
+    OUTPUT = 1
+    PULLUP = 1
+    PULLDOWN = 2
+    HIGH = 1
+    LOW = 0
+
+    levels = {}
+
+
+    @staticmethod
+    def init():
+        pass
+
+
+    @staticmethod
+    def setcfg(pin, config):
+        pass
+
+
+    @staticmethod
+    def pullup(pin, config):
+        pass
+
+
+    @staticmethod
+    def input(pin):
+        return FakeGPIO.levels.get(pin, 1)
+
+
+    @staticmethod
+    def press(pin, duration = .05):
+        FakeGPIO.levels[pin] = 0
+        time.sleep(duration)
+        FakeGPIO.levels[pin] = 1
+
+
+class FakePort(object):
+    """
+    pyA20 port/connector modules: every pin name maps to itself
+
+    """
+
+    def __getattr__(self, name):
+        return name
+
+
+def install():
+    smbus = ModuleType("smbus")
+    smbus.SMBus = FakeSMBus
+
+    serial = ModuleType("serial")
+    serial.Serial = FakeSerial
+    serial.EIGHTBITS = 8
+    serial.SerialException = OSError
+
+    pyA20 = ModuleType("pyA20")
+    pyA20_gpio = ModuleType("pyA20.gpio")
+    pyA20_gpio.gpio = FakeGPIO
+    pyA20_gpio.port = FakePort()
+    pyA20_gpio.connector = FakePort()
+    pyA20.gpio = pyA20_gpio
+
+    sys.modules["smbus"] = smbus
+    sys.modules["smbus2"] = None        # Use the SMBus block write path with the fake bus
+    sys.modules["serial"] = serial
+    sys.modules["pyA20"] = pyA20
+    sys.modules["pyA20.gpio"] = pyA20_gpio
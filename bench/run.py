@@ -0,0 +1,533 @@
+"""
+Headless benchmark of the box
+
+Runs the real state machine against fake hardware and a local fake API, then reports:
+
+- tap-to-menu and tap-to-confirm latency of the start and stop work paths
+- press-to-redraw latency while scrolling a long, paginated list of projects
+- tap-to-message latency of an unknown card, rejected by the local tag index
+- reads of a card left on the reader, alone or held through a menu
+- start/stop work throughput of several stations served at once
+- tap-to-message latency while the server does not answer, and the time until the prober sees it again
+- LCD frames per second and I2C transactions/bytes per screen
+- CPU time used per minute while idle
+
+Usage, on any Linux machine with requests installed:
+
+    python3 bench/run.py [--latency 0.02] [--taps 10] [--scroll 45] [--stations 4] [--idle 10] [--json out.json]
+                         [--baseline old.json] [--tolerance 0.2]
+
+With --baseline the results are compared with a previous --json output and the
+exit status is 1 if any metric got worse by more than the tolerance
+
+"""
+
+
+from functools import partial
+import argparse, json, os, sys, tempfile, threading, asyncio, time
+
+import fakes
+
+
+TAG_ID = "0001193046"       # Decimal form of the tag in TAG_FRAME
+TAG_DATA = b"0A00123456"
+SCROLL_TAG_ID = "0006636321"
+SCROLL_TAG_DATA = b"0A00654321"
+SCROLL_PROJECTS = 60        # Three pages of the default size
+UNKNOWN_TAG_DATA = b"0A00ABCDEF"
+HELD_TAG_DATA = b"0A00FEDCBA"   # Unknown too, read by no other scenario
+HELD_VALID_TAG_ID = "0007829367"
+HELD_VALID_TAG_DATA = b"0A00777777"
+HELD_VALID_USER = "A. Tinut"    # Header of the menu of HELD_VALID_TAG_ID
+STATION_TAG_BASE = 0x200000
+
+# Buttons are held and released for this many debounce times, so a sampler thread
+# delayed by the other threads of the benchmark still sees every press
+
+PRESS_TIME = 4
+
+# I2C timing used to estimate the time on the bus: 9 clocks per byte and
+# about 11 more per transaction for start, address and stop, at 100 kHz
+
+I2C_CLOCK = 100000
+
+
+def frame(data):
+    checksum = 0
+
+    for i in range(0, 10, 2):
+        checksum ^= int(data[i: i + 2], 16)
+
+    return b"\x02" + data + b"%02X" % checksum + b"\x03"
+
+
+def bus_seconds(transactions, sent):
+    return (sent * 9 + transactions * 11) / I2C_CLOCK
+
+
+def wait_for(condition, timeout = 10):
+    end = time.monotonic() + timeout
+
+    while not condition():
+        if time.monotonic() > end:
+            raise TimeoutError("benchmark scenario got stuck")
+
+        time.sleep(.001)
+
+    return time.monotonic()
+
+
+def percentile(values, p):
+    values = sorted(values)
+
+    return values[min(int(len(values) * p), len(values) - 1)]
+
+
+def measure_screens(G, lcd_driver, screens, config):
+    """
+    I2C cost of typical screens and LCD throughput, on a driver of its own
+
+    """
+
+    FakeSMBus = fakes.FakeSMBus
+    results = {}
+
+    lcd = lcd_driver.LCD_Driver()
+
+    idle = [
+        "Sun, 18.10  12:00:00",
+        config.locale["SCAN"] + "..",
+        "",
+        screens.IDLE_FOOTER
+    ]
+
+    FakeSMBus.reset()
+    lcd.Print(idle)
+    results["i2c_transactions_full_screen"] = FakeSMBus.transactions
+    results["i2c_bytes_full_screen"] = FakeSMBus.bytes
+    full_screen_bus = bus_seconds(FakeSMBus.transactions, FakeSMBus.bytes)
+
+    idle[0] = "Sun, 18.10  12:00:01"
+
+    FakeSMBus.reset()
+    lcd.Print(idle)
+    results["i2c_transactions_clock_tick"] = FakeSMBus.transactions
+    results["i2c_bytes_clock_tick"] = FakeSMBus.bytes
+
+    lcd.clear()
+
+    FakeSMBus.reset()
+    lcd.Print(screens.message(config.locale["PROJ_A"]))
+    results["i2c_bytes_message"] = FakeSMBus.bytes
+
+    # Alternate two full screens as fast as possible
+
+    other = [line.upper() if isinstance(line, str) else line.lower() for line in idle]
+    frames = 0
+    end = time.perf_counter() + 1
+
+    while time.perf_counter() < end:
+        lcd.Print(idle if frames % 2 else other)
+        frames += 1
+
+    results["fps_cpu"] = frames
+    results["fps_bus_estimate"] = min(frames, 1 / full_screen_bus)
+
+    return results
+
+
+def measure_taps(G, config, api, taps):
+    """
+    Start and stop work on the same tag, alternately
+
+    """
+
+    gpio = fakes.FakeGPIO
+
+    def shown(text):
+        return lambda: any(text in line for line in G.lcd.contents())
+
+    menu_latencies = []
+    confirm_latencies = []
+    press_latencies = []
+    i2c = []
+
+    requests = api.requests
+    sent = api.bytes_sent
+    not_modified = api.not_modified
+
+    for tap in range(taps):
+        wait_for(shown(config.locale["SCAN"]))
+
+        starting = TAG_ID not in api.started
+
+        fakes.FakeSMBus.reset()
+
+        start = time.monotonic()
+        fakes.FakeSerial.ports["/dev/ttyS1"].feed(frame(TAG_DATA))
+
+        menu = wait_for(shown("OK" if starting else "Stop"))
+
+        pressed = time.monotonic()
+        threading.Thread(target = gpio.press, args = (G.left_button, PRESS_TIME * config.button_debounce)).start()
+
+        confirmed = wait_for(shown(config.locale["PROJ_A" if starting else "PROJ_UA"]))
+
+        menu_latencies.append(menu - start)
+        confirm_latencies.append(confirmed - start)
+        press_latencies.append(confirmed - pressed)
+        i2c.append(fakes.FakeSMBus.transactions)
+
+        # Let the journal reach the server before the next tap of the same tag
+
+        wait_for(lambda: len(G.journal) == 0)
+
+    return {
+        "tap_to_menu_p50_ms": percentile(menu_latencies, .5) * 1000,
+        "tap_to_menu_p90_ms": percentile(menu_latencies, .9) * 1000,
+        "tap_to_confirm_p50_ms": percentile(confirm_latencies, .5) * 1000,
+        "tap_to_confirm_p90_ms": percentile(confirm_latencies, .9) * 1000,
+        "press_to_confirm_p50_ms": percentile(press_latencies, .5) * 1000,
+        "i2c_transactions_per_tap": sum(i2c) / len(i2c),
+        "api_requests_per_tap": (api.requests - requests) / taps,
+        "api_bytes_per_tap": (api.bytes_sent - sent) / taps,
+        "api_not_modified_per_tap": (api.not_modified - not_modified) / taps
+    }
+
+
+def measure_scroll(G, config, presses):
+    """
+    Scroll through the projects of a tag with many of them, then start the last one shown
+
+    """
+
+    gpio = fakes.FakeGPIO
+
+    def selected(i):
+        i %= SCROLL_PROJECTS + 1
+        text = config.locale["BACK"] if i == SCROLL_PROJECTS else f"CMD{100 + i} Op {i + 1}"
+
+        return lambda: text in G.lcd.contents()[1]
+
+    wait_for(lambda: config.locale["SCAN"] in G.lcd.contents()[1])
+
+    fakes.FakeSerial.ports["/dev/ttyS1"].feed(frame(SCROLL_TAG_DATA))
+    wait_for(selected(0))
+
+    latencies = []
+
+    for i in range(1, presses + 1):
+        pressed = time.monotonic()
+        press = threading.Thread(target = gpio.press, args = (G.right_button, PRESS_TIME * config.button_debounce))
+        press.start()
+
+        latencies.append(wait_for(selected(i)) - pressed)
+
+        press.join()
+        time.sleep(PRESS_TIME * config.button_debounce)      # Released long enough to count the next press
+
+    gpio.press(G.left_button, PRESS_TIME * config.button_debounce)
+    wait_for(lambda: config.locale["SCAN"] in G.lcd.contents()[1])
+    wait_for(lambda: len(G.journal) == 0)
+
+    return {
+        "scroll_press_to_redraw_p50_ms": percentile(latencies, .5) * 1000,
+        "scroll_press_to_redraw_p90_ms": percentile(latencies, .9) * 1000
+    }
+
+
+def measure_unknown(G, config, taps):
+    """
+    Taps of a card the server does not know
+
+    """
+
+    def shown(text):
+        return lambda: any(text in line for line in G.lcd.contents())
+
+    wait_for(lambda: len(G.allowlist) > 0)
+
+    latencies = []
+
+    for tap in range(taps):
+        wait_for(shown(config.locale["SCAN"]))
+
+        start = time.monotonic()
+        fakes.FakeSerial.ports["/dev/ttyS1"].feed(frame(UNKNOWN_TAG_DATA))
+
+        latencies.append(wait_for(shown(config.locale["INVALID"])) - start)
+
+    return {"unknown_tag_p50_ms": percentile(latencies, .5) * 1000}
+
+
+def measure_held(G, config, window):
+    """
+    Cards left on the reader, which repeats their frame ten times a second:
+
+    - a card the server does not know, back on the scan screen 0.2 s after its message
+    - a valid card held through its menu for longer than the window, then confirmed
+
+    Counts the times each card is read, once if the repeated frames are dropped
+
+    """
+
+    gpio = fakes.FakeGPIO
+
+    def hold(data, text, seconds, press_at = None):
+        """
+        Feeds the frame of a card for `seconds`, pressing OK after `press_at` seconds if given
+
+        Returns :
+            The number of times `text` appeared on the display
+
+        """
+
+        reads = 0
+        shown = False
+        feed = start = time.monotonic()
+
+        while time.monotonic() < start + seconds:
+            if time.monotonic() >= feed:
+                fakes.FakeSerial.ports["/dev/ttyS1"].feed(frame(data))
+                feed += .1
+
+            if press_at is not None and time.monotonic() >= start + press_at:
+                threading.Thread(target = gpio.press, args = (G.left_button, PRESS_TIME * config.button_debounce)).start()
+                press_at = None
+
+            visible = any(text in line for line in G.lcd.contents())
+            reads += visible and not shown
+            shown = visible
+
+            time.sleep(.005)
+
+        return reads
+
+    wait_for(lambda: config.locale["SCAN"] in G.lcd.contents()[1])
+
+    config.tag_repeat_window = window
+
+    unknown = hold(HELD_TAG_DATA, config.locale["INVALID"], 3)
+    valid = hold(HELD_VALID_TAG_DATA, HELD_VALID_USER, window + 3, window + 1)
+
+    config.tag_repeat_window = 0
+
+    wait_for(lambda: config.locale["SCAN"] in G.lcd.contents()[1])
+    wait_for(lambda: len(G.journal) == 0)
+
+    return {"held_card_reads": unknown, "held_valid_card_reads": valid}
+
+
+def measure_stations(config, stations, rounds):
+    """
+    Every station starts or stops work at the same time, round after round
+
+    Station i uses the tag with ID STATION_TAG_BASE + i
+
+    """
+
+    gpio = fakes.FakeGPIO
+
+    def shown(station, text):
+        return lambda: any(text in line for line in station.lcd.contents())
+
+    def tap(i, station):
+        wait_for(shown(station, config.locale["SCAN"]))
+
+        fakes.FakeSerial.ports[station.serial_port].feed(frame(b"0A00%06X" % (STATION_TAG_BASE + i)))
+        wait_for(lambda: any(text in "".join(station.lcd.contents()) for text in ("OK", "Stop")))
+
+        gpio.press(station.left_button, PRESS_TIME * config.button_debounce)
+        wait_for(lambda: any(
+            config.locale[message] in "".join(station.lcd.contents()) for message in ("PROJ_A", "PROJ_UA")
+        ))
+
+    start = time.monotonic()
+
+    for _ in range(rounds):
+        threads = [threading.Thread(target = tap, args = (i, station)) for i, station in enumerate(stations)]
+
+        for thread in threads:
+            thread.start()
+
+        for thread in threads:
+            thread.join()
+
+    return {"stations_taps_per_second": rounds * len(stations) / (time.monotonic() - start)}
+
+
+def measure_outage(G, config, api, taps):
+    """
+    Taps while the server does not answer, then waits until the prober sees it online again
+
+    """
+
+    from Spalek.common.breaker import CircuitBreaker
+
+    def shown(*texts):
+        return lambda: any(text in line for line in G.lcd.contents() for text in texts)
+
+    latency, timeout = api.latency, G.api.timeout
+
+    api.latency = 1
+    G.api.timeout = .1
+    G.api.breaker = CircuitBreaker(config.breaker_failures, 2, 2)
+
+    errors = [config.locale[name].split("\n")[0] for name in ("REQ_TO", "SRV_UNREACH")]
+    latencies = []
+
+    for tap in range(taps):
+        wait_for(shown(config.locale["SCAN"]))
+
+        start = time.monotonic()
+        fakes.FakeSerial.ports["/dev/ttyS1"].feed(frame(TAG_DATA))
+
+        latencies.append(wait_for(shown(*errors)) - start)
+
+    api.latency = latency
+    G.api.timeout = timeout
+
+    # Back on the Idle screen the footer carries the offline icon, until the prober closes the circuit
+
+    wait_for(lambda: G.lcd.contents()[3].startswith("\x04"))
+    recovered = time.monotonic()
+
+    return {
+        "outage_tap_p50_ms": percentile(latencies, .5) * 1000,
+        "outage_recovery_s": wait_for(lambda: G.prober.online and not G.lcd.contents()[3].startswith("\x04")) - recovered
+    }
+
+
+def measure_idle(G, config, seconds):
+    wait_for(lambda: config.locale["SCAN"] in G.lcd.contents()[1])
+
+    start = time.process_time()
+    time.sleep(seconds)
+
+    return {"cpu_seconds_per_idle_minute": (time.process_time() - start) * 60 / seconds}
+
+
+# Metrics where a higher value is better, every other one is better lower
+
+HIGHER_IS_BETTER = {"fps_cpu", "fps_bus_estimate", "stations_taps_per_second"}
+
+
+def compare(results, baseline, tolerance):
+    regressions = []
+
+    for name, value in results.items():
+        old = baseline.get(name)
+
+        if not old:
+            continue
+
+        change = (value - old) / old
+
+        if name in HIGHER_IS_BETTER:
+            change = -change
+
+        if change > tolerance:
+            regressions.append(f"{name}: {old:.3f} -> {value:.3f}")
+
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description = "Headless benchmark of the box")
+    parser.add_argument("--latency", type = float, default = .02, help = "seconds of latency of every API call")
+    parser.add_argument("--taps", type = int, default = 10, help = "number of taps to measure")
+    parser.add_argument("--scroll", type = int, default = 45, help = "number of presses while scrolling the list of projects")
+    parser.add_argument("--stations", type = int, default = 4, help = "number of stations served at once")
+    parser.add_argument("--idle", type = float, default = 10, help = "seconds to measure idle CPU use over")
+    parser.add_argument("--json", help = "write the results to this file")
+    parser.add_argument("--baseline", help = "results of a previous run to compare with")
+    parser.add_argument("--tolerance", type = float, default = .2, help = "allowed relative regression")
+    args = parser.parse_args()
+
+    fakes.install()
+
+    # Keep the log, caches and journal out of the device paths, and make the
+    # checkout importable as "Spalek" whatever its directory is called
+
+    work_dir = tempfile.mkdtemp(prefix = "spalek-bench-")
+
+    os.environ["SPALEK_DATA_DIR"] = work_dir
+    os.symlink(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), os.path.join(work_dir, "Spalek"))
+    sys.path.insert(0, work_dir)
+
+    import Spalek
+    import Spalek.__global_var as G
+    from Spalek.common import config, screens
+    from Spalek.common.code import run_machine
+    from Spalek.util import lcd_driver
+    from Spalek.machine import Idle
+    from Spalek.util.station import Station
+    from server import ApiState, ApiServer
+
+    api = ApiState(args.latency)
+    api.add_tag(TAG_ID, "Ion", "Popescu", 6)
+    api.add_tag(SCROLL_TAG_ID, "Maria", "Ionescu", 7, SCROLL_PROJECTS)
+    api.add_tag(HELD_VALID_TAG_ID, "Ana", "Tinut", 8)
+
+    # Stations after the first one get their own reader, LCD address and pins
+
+    stations = list(G.stations)
+
+    for i in range(len(stations), args.stations):
+        stations.append(Station(f"bench{i}", f"/dev/ttyS{i + 1}", 0x27 + i, f"PB{3 * i}", f"PB{3 * i + 1}", f"PB{3 * i + 2}"))
+        stations[-1].start(Spalek.fontdata1)
+
+    for i in range(len(stations)):
+        api.add_tag("000" + str(STATION_TAG_BASE + i), "Station", str(i), 100 + i)
+
+    server = ApiServer(api)
+
+    G.api.base_url = server.url
+    config.backToIdle_timeout = .2
+    config.probe_interval_offline = .5
+
+    # The scenarios tap the same cards in quick succession, only the held card one drops repeated reads
+
+    tag_repeat_window = config.tag_repeat_window
+    config.tag_repeat_window = 0
+
+    G.journal.start()
+    G.allowlist.start()
+    G.prober.start()
+
+    async def run_stations():
+        await asyncio.gather(*(run_machine(Idle(station), partial(Idle, station)) for station in stations))
+
+    machine = threading.Thread(target = lambda: asyncio.run(run_stations()), name = "machine", daemon = True)
+    machine.start()
+
+    results = {}
+    results.update(measure_screens(G, lcd_driver, screens, config))
+    results.update(measure_taps(G, config, api, args.taps))
+    results.update(measure_scroll(G, config, args.scroll))
+    results.update(measure_unknown(G, config, args.taps))
+    results.update(measure_held(G, config, tag_repeat_window))
+    results.update(measure_stations(config, stations, args.taps))
+    results.update(measure_outage(G, config, api, args.taps))
+    results.update(measure_idle(G, config, args.idle))
+
+    for name, value in results.items():
+        print(f"{name:32} {value:12.3f}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent = 4)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+
+        for line in regressions:
+            print("REGRESSION " + line)
+
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
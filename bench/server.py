@@ -0,0 +1,265 @@
+"""
+Local HTTP server implementing the endpoints of the Postman collection
+
+"""
+
+
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from socketserver import ThreadingMixIn
+from urllib.parse import urlsplit, parse_qs
+import threading, json, time, zlib
+
+
+class ApiState(object):
+    """
+    Data served by the fake API
+
+    ...
+    Attributes
+    ----------
+    latency : float
+        Seconds every request is delayed by
+
+    tags : dict
+        Tag ID -> {"fname", "lname", "emplid"}
+
+    orders : dict
+        Tag ID -> number of alloc_orders records returned for it
+
+    started : dict
+        Tag ID -> running timetracking record
+
+    """
+
+
+    def __init__(self, latency = 0):
+        self.latency = latency
+        self.tags = {}
+        self.orders = {}
+        self.started = {}
+        self.requests = 0
+        self.not_modified = 0       # GETs answered with 304
+        self.bytes_sent = 0         # Response bodies
+
+        self.__next_id = 1
+        self.__lock = threading.Lock()
+
+
+    def add_tag(self, tagID, fname, lname, emplid, orders = 1):
+        self.tags[tagID] = {"fname": fname, "lname": lname, "emplid": emplid}
+        self.orders[tagID] = orders
+
+
+    def alloc_orders(self, tagID):
+        tag = self.tags[tagID]
+
+        return [
+            {
+                "id": i + 1,
+                "type": "alloc_orders",
+                "attributes": {
+                    "fname": tag["fname"],
+                    "lname": tag["lname"],
+                    "emplid": str(tag["emplid"]),
+                    "order_id": str(100 + i),
+                    "order_name": f"CMD{100 + i}",
+                    "op_id": str(i + 1),
+                    "op_name": f"Op {i + 1}",
+                    "hourlyrate": "10",
+                    "currency": "EUR"
+                }
+            }
+            for i in range(self.orders[tagID])
+        ]
+
+
+    def start_work(self, attributes):
+        with self.__lock:
+            jobID = self.__next_id
+            self.__next_id += 1
+
+        for tagID, tag in self.tags.items():
+            if tag["emplid"] == attributes["employee"]:
+                self.started[tagID] = {
+                    "id": jobID,
+                    "type": "timetracking",
+                    "attributes": {
+                        "order_label": f"CMD{attributes['order']}",
+                        "operation_name": f"Op {attributes['operation']}",
+                        "worktime": "00:00"
+                    }
+                }
+
+        return {"id": jobID, "type": "timetracking", "attributes": attributes}
+
+
+    def stop_work(self, jobID):
+        for tagID, record in list(self.started.items()):
+            if record["id"] == jobID:
+                del self.started[tagID]
+
+                return {"id": jobID, "type": "timetracking", "attributes": {"status": "f"}}
+
+        return None
+
+
+class ApiHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"       # Keep-alive, like the real server
+
+
+    def log_message(self, format, *args):
+        pass
+
+
+    def __send(self, status, document):
+        body = json.dumps(document).encode()
+
+        # Documents are tagged with a hash of their body, like a server with conditional GET support
+
+        if self.command == "GET" and status in (200, 202):
+            etag = '"%08x"' % zlib.crc32(body)
+
+            if self.headers.get("If-None-Match") == etag:
+                self.server.api.not_modified += 1
+
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.end_headers()
+
+                return
+
+            self.send_response(status)
+            self.send_header("ETag", etag)
+        else:
+            self.send_response(status)
+
+        self.server.api.bytes_sent += len(body)
+
+        self.send_header("Content-Type", "application/vnd.api+json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+    def __body(self):
+        length = int(self.headers.get("Content-Length", 0))
+
+        return json.loads(self.rfile.read(length)) if length else None
+
+
+    def __begin(self):
+        api = self.server.api
+        api.requests += 1
+
+        if api.latency:
+            time.sleep(api.latency)
+
+        url = urlsplit(self.path)
+
+        return api, [part for part in url.path.split("/") if part], parse_qs(url.query)
+
+
+    def __page(self, records, query):
+        """
+        Sends the page of a collection asked for with JSON:API page parameters, the last page has no next link
+
+        """
+
+        # An empty collection is answered with 202, like the real API
+
+        if not records:
+            return self.__send(202, {"data": []})
+
+        if "page[size]" not in query:
+            return self.__send(200, {"data": records})
+
+        number = int(query.get("page[number]", ["1"])[0])
+        size = int(query["page[size]"][0])
+        document = {"data": records[(number - 1) * size: number * size], "links": {}}
+
+        if number * size < len(records):
+            document["links"]["next"] = f"{urlsplit(self.path).path}?page[number]={number + 1}&page[size]={size}"
+
+        self.__send(200, document)
+
+
+    def do_GET(self):
+        api, path, query = self.__begin()
+
+        if path[0] == "timetracking":
+            return self.__send(200, {"data": list(api.started.values())})
+
+        if len(path) == 1:
+            return self.__page([{"id": tagID, "type": "tags"} for tagID in api.tags], query)
+
+        tagID = path[1]
+
+        if tagID not in api.tags:
+            return self.__send(200, {"data": None})
+
+        if len(path) == 2:
+            return self.__send(200, {"data": {"id": tagID, "type": "tags", "attributes": api.tags[tagID]}})
+
+        if path[2] == "started_work":
+            record = api.started.get(tagID)
+
+            # Like the real API, 202 with an empty collection when no work is running
+
+            return self.__send(200 if record else 202, {"data": [record] if record else []})
+
+        if path[2] == "alloc_orders":
+            return self.__page(api.alloc_orders(tagID), query)
+
+        self.__send(404, {"data": None})
+
+
+    def do_HEAD(self):
+        """
+        Answers the probes of the box, which are left out of the request count
+
+        """
+
+        api = self.server.api
+
+        if api.latency:
+            time.sleep(api.latency)
+
+        self.send_response(204)
+        self.end_headers()
+
+
+    def do_POST(self):
+        api, path, query = self.__begin()
+
+        self.__send(201, {"data": api.start_work(self.__body()["data"]["attributes"])})
+
+
+    def do_PATCH(self):
+        api, path, query = self.__begin()
+
+        self.__body()
+        record = api.stop_work(int(path[1]))
+
+        self.__send(200 if record else 404, {"data": record})
+
+
+class ApiServer(ThreadingMixIn, HTTPServer):
+    """
+    Fake API listening on localhost, served from a background thread
+
+    """
+
+    daemon_threads = True
+
+
+    def __init__(self, api, port = 0):
+        super().__init__(("127.0.0.1", port), ApiHandler)
+
+        self.api = api
+
+        threading.Thread(target = self.serve_forever, name = "api-server", daemon = True).start()
+
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_port}"
@@ -0,0 +1,244 @@
+"""
+This file holds the local index of the valid tags, used to reject unknown cards without a call to the API
+
+"""
+
+
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+from array import array
+from bisect import bisect_left
+from time import time, sleep
+import threading, struct, mmap, os, logging
+
+from Spalek.common import config
+from Spalek.common.pages import page_path
+from Spalek.common.lazy import LazyModule
+from Spalek.common.breaker import CircuitOpenError
+
+
+requests = LazyModule("requests")
+
+
+class Allowlist(object):
+    """
+    Sorted array of the numeric IDs of the valid tags, memory mapped from a file
+
+    A background thread requests the tags changed since the last sync and merges
+    them in; removed tags are only dropped by the periodic full sync, which is safe
+    since a removed tag still listed just goes to the server, which rejects it
+
+    As long as the index was never synced or is older than config.allowlist_max_age,
+    every tag is let through to the server
+
+    A full sync that returns no tag, or less than SHRINK_LIMIT of the tags in the index,
+    is not trusted: the index is kept as it is and goes stale, so a server answering
+    with an empty list cannot lock every card out
+
+    File format: header (magic, count, watermark, synced, rebuilt), then count
+    unsigned 64 bit IDs in ascending order
+
+    """
+
+    HEADER = struct.Struct("<4sQddd")
+    MAGIC = b"TAGS"
+    SHRINK_LIMIT = .5
+
+
+    def __init__(self, path, client):
+        """
+        Parameters
+        ----------
+
+        path : string
+            Index file, None to let every tag through
+
+        client : ApiClient
+            Client the tags are requested with
+
+        """
+
+        self.path = path
+
+        self.__client = client
+        self.__thread = None
+
+        self.__index = None         # mmap of the file and a view of its IDs, replaced as a whole
+        self.__watermark = None     # Server time of the last sync, the next one asks for changes since then
+        self.__synced = 0           # Local time of the last successful sync
+        self.__rebuilt = 0          # Local time of the last full sync
+
+        if path is not None:
+            self.__load()
+
+
+    def __len__(self):
+        return 0 if self.__index is None else len(self.__index[1])
+
+
+    def __load(self):
+        try:
+            with open(self.path, "rb") as f:
+                mapped = mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ)
+
+        except (FileNotFoundError, ValueError):
+            return      # Missing or empty
+
+        magic, count, watermark, synced, rebuilt = self.HEADER.unpack_from(mapped)
+
+        if magic != self.MAGIC or len(mapped) != self.HEADER.size + count * 8:
+            logging.warning(f"ALLOWLIST: {self.path} is damaged, waiting for a full sync")
+            return
+
+        ids = memoryview(mapped)[self.HEADER.size:].cast("Q")
+
+        self.__index = (mapped, ids)
+        self.__watermark = watermark or None
+        self.__synced = synced
+        self.__rebuilt = rebuilt
+
+
+    @property
+    def fresh(self):
+        """
+        True if the index can be trusted to reject tags
+
+        """
+
+        return self.__index is not None and time() - self.__synced < config.allowlist_max_age
+
+
+    def __contains__(self, tagID):
+        """
+        True if the tag may be valid: it is in the index, or the index cannot be trusted
+
+        """
+
+        if not self.fresh:
+            return True
+
+        try:
+            number = int(tagID)
+        except ValueError:
+            return False
+
+        ids = self.__index[1]
+        i = bisect_left(ids, number)
+
+        return i < len(ids) and ids[i] == number
+
+
+    def __fetch(self, since):
+        """
+        Requests the IDs of the tags changed since a server time, or of all the tags
+
+        Returns :
+            The IDs and the server time of the answer
+
+        """
+
+        path = "/tags?fields[tags]=id"
+
+        if since is not None:
+            path += "&filter[updated_since]=" + datetime.fromtimestamp(since, timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+        ids = set()
+        number = 1
+        server_time = None
+        previous = None
+
+        while True:
+            resp = self.__client.get(page_path(path, number))
+            resp.raise_for_status()
+
+            if server_time is None and "Date" in resp.headers:
+                server_time = parsedate_to_datetime(resp.headers["Date"]).timestamp()
+
+            document = resp.json()
+            data = document.get("data") or []
+
+            # A server that ignores the page number sends the same page again
+
+            page = [str(record["id"]) for record in data]
+
+            if page == previous:
+                logging.warning(f"ALLOWLIST: page {number} repeats page {number - 1}, paging ignored by the server")
+                return ids, server_time
+
+            previous = page
+
+            for id in page:
+                if id.isdigit():
+                    ids.add(int(id))
+
+            if not data or not (document.get("links") or {}).get("next"):
+                return ids, server_time
+
+            number += 1
+
+
+    def sync(self, full = False):
+        """
+        Merges the tags changed since the last sync into the index, or rebuilds it if full is True
+
+        Raises :
+            requests exceptions on connection errors, timeouts and error statuses
+            CircuitOpenError while the server is considered down
+            ValueError if a full sync returns no tag or far fewer than the index has
+            OSError if the index cannot be written
+
+        """
+
+        full = full or self.__index is None or self.__watermark is None
+
+        started = time()
+        ids, server_time = self.__fetch(None if full else self.__watermark)
+
+        if full and (not ids or len(ids) < len(self) * self.SHRINK_LIMIT):
+            raise ValueError(f"full sync returned {len(ids)} tags, the index has {len(self)}; keeping the index")
+
+        if not full:
+            ids.update(self.__index[1])
+
+        # Without a Date header, fall back on the local clock with some slack
+
+        watermark = server_time if server_time is not None else started - config.allowlist_refresh
+        rebuilt = started if full else self.__rebuilt
+
+        self.__write(sorted(ids), watermark, started, rebuilt)
+        self.__load()
+
+
+    def __write(self, ids, watermark, synced, rebuilt):
+        tmp = self.path + ".tmp"
+
+        with open(tmp, "wb") as f:
+            f.write(self.HEADER.pack(self.MAGIC, len(ids), watermark, synced, rebuilt))
+            array("Q", ids).tofile(f)
+
+            f.flush()
+            os.fsync(f.fileno())
+
+        os.replace(tmp, self.path)
+
+
+    def start(self):
+        """
+        Starts the background sync
+
+        """
+
+        if self.path is not None and self.__thread is None:
+            self.__thread = threading.Thread(target = self.__refresh, name = "allowlist", daemon = True)
+            self.__thread.start()
+
+
+    def __refresh(self):
+        while True:
+            try:
+                self.sync(time() - self.__rebuilt >= config.allowlist_rebuild)
+
+            except (requests.RequestException, CircuitOpenError, ValueError, KeyError, OSError) as e:
+                logging.warning("ALLOWLIST: " + str(e))
+
+            sleep(config.allowlist_refresh)
@@ -0,0 +1,284 @@
+"""
+This file holds the HTTP client used by the states to call the API
+
+"""
+
+
+from time import monotonic
+import json, re, threading
+from concurrent.futures import ThreadPoolExecutor
+
+from Spalek.common import config
+from Spalek.common.cache import TTLCache
+from Spalek.common.breaker import CircuitBreaker
+from Spalek.common.trace import tracer
+from Spalek.common.lazy import LazyModule
+
+
+requests = LazyModule("requests")
+
+
+JSON_API = "application/vnd.api+json"
+
+# A gateway in front of a server that is down answers these
+
+GATEWAY_ERRORS = (502, 503, 504)
+
+
+class ApiClient(object):
+    """
+    Keep-alive client for the time tracking API
+
+    A single session is shared by all states, so consecutive calls reuse the pooled
+    TCP connections to the server instead of opening a new one for every request
+
+    Calls can also be started in the background with submit() and get_async(),
+    which return a concurrent.futures.Future of the response
+
+    The session, and with it the requests module, is created on first use or by warm_up()
+
+    All calls go through a circuit breaker: while the server is down they fail at once
+    with CircuitOpenError instead of waiting for the timeout
+
+    in_flight and last_success tell the background prober when the connections are in use
+
+    get_cached() keeps the validators (ETag, Last-Modified) of the responses with their
+    decoded bodies, so a repeated call is a conditional request and a 304 reuses the
+    models decoded the first time
+
+    """
+
+
+    def __init__(self, base_url = config.serverIP, timeout = config.timeout, pool_size = config.api_pool_size):
+        """
+        Parameters
+        ----------
+
+        base_url : string
+            Root URL of the API, paths are appended to it
+
+        timeout : float
+            Default timeout of a call in seconds
+
+        pool_size : int
+            Number of connections kept open to the server
+
+        """
+
+        self.base_url = base_url
+        self.timeout = timeout
+        self.pool_size = pool_size
+
+        self.__session = None
+        self.__session_lock = threading.Lock()
+
+        self.__executor = ThreadPoolExecutor(max_workers = pool_size)
+
+        self.breaker = CircuitBreaker(config.breaker_failures, config.breaker_reset, config.breaker_reset_max)
+
+        self.in_flight = 0              # Calls waiting on the server
+        self.last_success = None        # monotonic() time of the last call answered by the server
+        self.__flight_lock = threading.Lock()
+
+        # Path -> (ETag, Last-Modified, decoded body); validators never expire, the server checks them
+
+        self.__validated = TTLCache(config.api_cache_size, float("inf"))
+        self.__validated_lock = threading.Lock()
+
+
+    def __get_session(self):
+        with self.__session_lock:
+            if self.__session is None:
+                session = requests.Session()
+                session.headers.update({"Content-Type": JSON_API})
+
+                adapter = requests.adapters.HTTPAdapter(pool_connections = 1, pool_maxsize = self.pool_size)
+
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+
+                self.__session = session
+
+            return self.__session
+
+
+    def warm_up(self):
+        """
+        Loads the HTTP stack ahead of the first call
+
+        """
+
+        self.__get_session()
+
+
+    def request(self, method, path, data = None, timeout = None, headers = None, probe = False):
+        """
+        Makes a call to the API
+
+        Parameters
+        ----------
+
+        method : string
+            HTTP method
+
+        path : string
+            Path relative to the API root, e.g. "/tags/0001234567"
+
+        data : dict
+            Document sent as the JSON body, if any
+
+        timeout : float
+            Overrides the default timeout for this call
+
+        headers : dict
+            Headers added to the default ones for this call
+
+        probe : bool
+            True for a background health check, whose failure does not count toward
+            opening the circuit breaker; its success closes it
+
+        Returns :
+            The response object
+
+        Raises :
+            requests exceptions on connection errors and timeouts
+            CircuitOpenError while the server is considered down
+
+        """
+
+        if data is not None:
+            data = json.dumps(data)
+
+        # IDs are left out of the span name, so calls to the same endpoint are grouped together
+
+        endpoint = re.sub("/[0-9]+", "/{id}", path)
+
+        self.breaker.before()
+
+        with self.__flight_lock:
+            self.in_flight += 1
+
+        try:
+            with tracer.span(method + " " + endpoint, "http"):
+                resp = self.__get_session().request(method, self.base_url + path, data = data, timeout = timeout or self.timeout, headers = headers)
+
+        except Exception:
+            self.breaker.failure(probe)
+            raise
+
+        finally:
+            with self.__flight_lock:
+                self.in_flight -= 1
+
+        if resp.status_code in GATEWAY_ERRORS:
+            self.breaker.failure(probe)
+        else:
+            self.breaker.success()
+            self.last_success = monotonic()
+
+        return resp
+
+
+    def get(self, path, timeout = None):
+        return self.request("GET", path, timeout = timeout)
+
+
+    def post(self, path, data, timeout = None):
+        return self.request("POST", path, data, timeout)
+
+
+    def patch(self, path, data, timeout = None):
+        return self.request("PATCH", path, data, timeout)
+
+
+    def get_cached(self, path, decode, timeout = None):
+        """
+        Makes a conditional GET, if the response to the same path was seen before
+
+        Parameters
+        ----------
+
+        decode : function
+            Turns the JSON document of a 200 or 202 response into the value cached with its validators
+
+        Returns :
+            The response object, with the decoded value in its `decoded` attribute: decoded
+            from the body on 200 and 202, taken from the cache on 304, None on other statuses
+
+        Raises :
+            requests exceptions on connection errors and timeouts
+
+        """
+
+        with self.__validated_lock:
+            cached = self.__validated.get(path)
+
+        headers = {}
+
+        if cached is not None:
+            etag, modified, value = cached
+
+            if etag is not None:
+                headers["If-None-Match"] = etag
+
+            if modified is not None:
+                headers["If-Modified-Since"] = modified
+
+        resp = self.request("GET", path, timeout = timeout, headers = headers)
+
+        if resp.status_code == 304 and cached is not None:
+            resp.decoded = cached[2]
+            return resp
+
+        # The API answers 202 with an empty collection, e.g. no work running or no assignable projects
+
+        answered = resp.status_code in (200, 202)
+        resp.decoded = decode(resp.json()) if answered else None
+
+        etag = resp.headers.get("ETag")
+        modified = resp.headers.get("Last-Modified")
+
+        with self.__validated_lock:
+            if answered and (etag is not None or modified is not None):
+                self.__validated.put(path, (etag, modified, resp.decoded))
+            else:
+                self.__validated.invalidate(path)
+
+        return resp
+
+
+    def submit(self, method, path, data = None, timeout = None, headers = None):
+        """
+        Starts a call in the background, so several calls can wait on the network at the same time
+
+        Coroutines await it with asyncio.wrap_future()
+
+        Returns :
+            A Future of the response, result() raises the same exceptions as request()
+
+        """
+
+        return self.__executor.submit(self.request, method, path, data, timeout, headers)
+
+
+    def get_async(self, path, timeout = None):
+        return self.submit("GET", path, timeout = timeout)
+
+
+    def get_cached_async(self, path, decode, timeout = None):
+        """
+        get_cached() in the background
+
+        Returns :
+            A Future of the response
+
+        """
+
+        return self.__executor.submit(self.get_cached, path, decode, timeout)
+
+
+    def close(self):
+        self.__executor.shutdown(wait = False)
+
+        if self.__session is not None:
+            self.__session.close()
@@ -0,0 +1,101 @@
+"""
+This file holds the circuit breaker that makes calls fail at once while the server is down
+
+"""
+
+
+from time import monotonic
+import threading, logging
+
+
+class CircuitOpenError(Exception):
+    """
+    Raised instead of making a call while the server is considered down
+
+    """
+
+
+class CircuitBreaker(object):
+    """
+    Counts the consecutive failed calls to the server
+
+    After `failures` of them the circuit opens and calls fail at once with CircuitOpenError.
+    Once `reset` seconds have passed, a single call is let through as a probe (half-open):
+    if it succeeds the circuit closes again, otherwise it stays open twice as long, up to `reset_max`
+
+    ...
+    Attributes
+    ----------
+    state : string
+        CLOSED, OPEN or HALF_OPEN
+
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half-open"
+
+
+    def __init__(self, failures = 3, reset = 5, reset_max = 60):
+        self.failures = failures
+        self.reset = reset
+        self.reset_max = reset_max
+
+        self.state = self.CLOSED
+
+        self.__lock = threading.Lock()
+        self.__count = 0            # Consecutive failures
+        self.__delay = reset        # Seconds the circuit stays open next time
+        self.__retry_at = 0         # monotonic() time of the next probe
+
+
+    def before(self):
+        """
+        Called before a call; makes the caller the probe when the circuit is due for one
+
+        Raises :
+            CircuitOpenError if the call must not be made
+
+        """
+
+        with self.__lock:
+            if self.state == self.CLOSED:
+                return
+
+            if self.state == self.OPEN and monotonic() >= self.__retry_at:
+                self.state = self.HALF_OPEN
+                return
+
+            raise CircuitOpenError(f"server unreachable, next try in {max(0, self.__retry_at - monotonic()):.1f} s")
+
+
+    def success(self):
+        with self.__lock:
+            if self.state != self.CLOSED:
+                logging.warning("API: server reachable again")
+
+            self.state = self.CLOSED
+            self.__count = 0
+            self.__delay = self.reset
+
+
+    def failure(self, probe = False):
+        """
+        Called after a failed call; a probe (probe = True) that fails while the circuit is
+        closed is not counted, so a background health check never opens the circuit
+
+        """
+
+        with self.__lock:
+            if probe and self.state == self.CLOSED:
+                return
+
+            self.__count += 1
+
+            if self.state == self.HALF_OPEN or self.__count >= self.failures:
+                if self.state == self.CLOSED:
+                    logging.warning(f"API: {self.__count} calls failed, failing fast for {self.__delay} s")
+
+                self.state = self.OPEN
+                self.__retry_at = monotonic() + self.__delay
+                self.__delay = min(self.__delay * 2, self.reset_max)
@@ -0,0 +1,169 @@
+"""
+This file holds a bounded cache with expiring entries
+
+"""
+
+
+from collections import OrderedDict
+from time import time
+import threading, json, os, logging
+
+
+class TTLCache(object):
+    """
+    Least recently used cache whose entries expire after a fixed time
+
+    Entries are stamped with the wall clock, so a snapshot saved to disk is still
+    valid after a restart
+
+    Changes are not written at once: the snapshot is saved by a background timer
+    `save_delay` seconds after the first change, so callers never wait on the disk
+
+    ...
+    Attributes
+    ----------
+    maxsize : int
+        Maximum number of entries, the least recently used one is evicted first
+
+    ttl : float
+        Seconds an entry stays valid
+
+    snapshot : string
+        Path of the JSON file the cache is saved to and loaded from, None to keep it in memory only
+
+    save_delay : float
+        Seconds the changes are gathered before the snapshot is saved
+
+    """
+
+
+    def __init__(self, maxsize = 256, ttl = 3600, snapshot = None, save_delay = 10):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.snapshot = snapshot
+        self.save_delay = save_delay
+
+        self.__entries = OrderedDict()      # key -> (expiry time, value)
+        self.__lock = threading.Lock()      # The saver thread copies the entries
+        self.__saver = None                 # Timer of the pending save, None if the snapshot is up to date
+
+        if snapshot is not None:
+            self.load()
+
+
+    def __len__(self):
+        return len(self.__entries)
+
+
+    def get(self, key):
+        """
+        Returns :
+            The cached value or None if the key is missing or expired
+
+        """
+
+        with self.__lock:
+            entry = self.__entries.get(key)
+
+            if entry is None:
+                return None
+
+            if entry[0] <= time():
+                del self.__entries[key]
+                return None
+
+            self.__entries.move_to_end(key)
+
+            return entry[1]
+
+
+    def put(self, key, value):
+        """
+        Stores a value, evicting the least recently used entries over maxsize,
+        and schedules a save of the snapshot if there is one
+
+        """
+
+        with self.__lock:
+            self.__entries[key] = (time() + self.ttl, value)
+            self.__entries.move_to_end(key)
+
+            while len(self.__entries) > self.maxsize:
+                self.__entries.popitem(last = False)
+
+        self.__changed()
+
+
+    def invalidate(self, key):
+        with self.__lock:
+            removed = self.__entries.pop(key, None) is not None
+
+        if removed:
+            self.__changed()
+
+
+    def clear(self):
+        with self.__lock:
+            self.__entries.clear()
+
+        self.__changed()
+
+
+    def __changed(self):
+        with self.__lock:
+            if self.snapshot is None or self.__saver is not None:
+                return
+
+            self.__saver = threading.Timer(self.save_delay, self.save)
+            self.__saver.daemon = True
+            self.__saver.start()
+
+
+    def save(self):
+        """
+        Writes the entries that have not expired to the snapshot file,
+        replacing it atomically so a power loss never leaves a partial file
+
+        """
+
+        now = time()
+
+        with self.__lock:
+            self.__saver = None
+            entries = [[key, expiry, value] for key, (expiry, value) in self.__entries.items() if expiry > now]
+
+        try:
+            with open(self.snapshot + ".tmp", "w") as f:
+                json.dump(entries, f)
+
+                f.flush()
+                os.fsync(f.fileno())
+
+            os.replace(self.snapshot + ".tmp", self.snapshot)
+
+        except OSError as e:
+            logging.warning("CACHE: " + str(e))
+
+
+    def load(self):
+        """
+        Loads the entries saved in the snapshot file, a missing or damaged file is ignored
+
+        """
+
+        try:
+            with open(self.snapshot) as f:
+                entries = json.load(f)
+
+        except FileNotFoundError:
+            return
+
+        except (OSError, ValueError) as e:
+            logging.warning("CACHE: " + str(e))
+            return
+
+        now = time()
+
+        for key, expiry, value in entries[-self.maxsize: ]:
+            if expiry > now:
+                self.__entries[key] = (expiry, value)
@@ -4,15 +4,45 @@ This file contains code that is used in multiple files of the program
 """
 
 
-from time import sleep
-from pyA20.gpio import gpio
-from datetime import datetime
+from time import perf_counter
+import asyncio, inspect, logging
+
+from Spalek.common.trace import tracer
+from Spalek.common.timers import scheduler
 
 
 class State(object):
+    """
+    Base class of the state machine's states
+
+    run() is either a plain method or a coroutine; a coroutine is awaited with
+    the state's timeout as deadline, so states doing I/O never block the event loop
+
+    Timeouts and periodic ticks are timers of the common scheduler (see timers.py):
+    the state gets timed_out set and a "TIME_OUT" event once timeout_seconds have passed
+
+    The constructor of every subclass is traced
+
+    States take the Station they run on as first argument and keep it in self.station,
+    so one state machine can run per station
+
+    """
+
+    station = None
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+
+        if "__init__" in cls.__dict__:
+            cls.__init__ = tracer.wrap(cls.__init__, cls.__name__ + ".__init__")
+
+
     def __init__(self, maxWait = 10):
-        self.startTime = datetime.now()
         self.timeout_seconds = maxWait
+        self.timed_out = False
+
+        self.__timeout = None
+        self.restart_timeout()
 
 
     def run(self):
@@ -23,9 +53,221 @@ class State(object):
         pass
 
 
-def read(button):
-    state = gpio.input(button)
+    def after(self, delay, callback):
+        """
+        Calls callback() from the main loop in `delay` seconds, unless the state was left
+
+        """
+
+        return scheduler.call_later(delay, callback, owner = self)
+
+
+    def every(self, interval, callback, delay = None):
+        """
+        Calls callback() from the main loop every `interval` seconds (first after `delay`)
+        until the state is left
+
+        """
+
+        return scheduler.call_later(interval if delay is None else delay, callback, interval, owner = self)
+
+
+    def restart_timeout(self):
+        """
+        Starts counting timeout_seconds again, e.g. after user input
+
+        """
+
+        if self.__timeout is not None:
+            self.__timeout.cancel()
+
+        self.timed_out = False
+
+        if self.timeout_seconds is None:
+            self.__timeout = None
+        else:
+            self.__timeout = self.after(self.timeout_seconds, self.__expire)
+
+
+    def cancel_timeout(self):
+        self.timeout_seconds = None
+        self.restart_timeout()
+
+
+    def __expire(self):
+        self.timed_out = True
+
+
+    def remaining(self):
+        """
+        Seconds left until the state times out, or None if the state has no timeout
+
+        """
+
+        if self.__timeout is None:
+            return None
+
+        return self.__timeout.remaining()
+
+
+    def waitables(self):
+        """
+        Objects with a fileno() method that wake the main loop when they have data to read
+
+        """
+
+        return []
+
+
+async def run_state(state):
+    """
+    Runs a state once, awaiting it if run() is a coroutine
+
+    Returns :
+        The event returned by run(), or "TIME_OUT" if the state's deadline passed first
+
+    """
+
+    e = state.run()
+
+    if not inspect.isawaitable(e):
+        return e
+
+    try:
+        return await asyncio.wait_for(e, state.remaining())
+
+    except asyncio.TimeoutError:
+        return "TIME_OUT"
+
+
+async def wait_for_event(state):
+    """
+    Waits until one of the state's waitables is readable or the next timer is due,
+    whichever comes first
+
+    """
+
+    timeout = scheduler.timeout(state)
+
+    if timeout is not None and timeout <= 0:
+        return
+
+    waitables = state.waitables()
+
+    if not waitables:
+        if timeout is not None:
+            await asyncio.sleep(timeout)
+
+        return
+
+    loop = asyncio.get_event_loop()
+    ready = loop.create_future()
+
+    def on_ready():
+        if not ready.done():
+            ready.set_result(None)
+
+    for w in waitables:
+        loop.add_reader(w, on_ready)
+
+    try:
+        await asyncio.wait_for(ready, timeout)
+
+    except asyncio.TimeoutError:
+        pass
+
+    finally:
+        for w in waitables:
+            loop.remove_reader(w)
+
+
+def transition(state, e, run_start = None):
+    """
+    Passes an event to a state, tracing run() and on_event() when the state changes
+
+    Passes that keep the same state are not traced, so waiting does not fill the trace buffer.
+    The timers of a state that is left are cancelled
+
+    Returns :
+        The next state
+
+    """
+
+    start = perf_counter()
+    next_state = state.on_event(e)
+
+    if next_state is not state:
+        scheduler.cancel_owner(state)
+
+        name = type(state).__name__
+
+        if run_start is not None:
+            tracer.record(name + ".run", "state", run_start, start - run_start)
+
+        args = {"next": type(next_state).__name__}
+
+        if state.station is not None:
+            args["station"] = state.station.name
+
+        tracer.record(name + ".on_event", "state", start, perf_counter() - start, args)
+
+    return next_state
+
+
+RESTART_DELAY = 1       # Seconds before a failed state machine starts over
+
+
+async def run_machine(state, restart = None):
+    """
+    Runs the state machine starting from the given state, forever
+
+    The machines of several stations run as tasks of the same event loop, sharing the timer scheduler
+
+    Parameters
+    ----------
+
+    restart : function
+        Returns the state to start over from (e.g. the station's Idle) after a state raised;
+        the error is logged, so one station failing does not stop the others. Without it,
+        the error is raised
+
+    """
+
+    station = state.station.name if state.station is not None else ""
+
+    while True:
+        try:
+            if state is None:
+                state = restart()
+
+            scheduler.run_due()
+
+            if state.timed_out:
+                state = transition(state, "TIME_OUT")
+
+            run_start = perf_counter()
+            next_state = transition(state, await run_state(state), run_start)
+
+            # Wait only while the state keeps waiting, transitions run back to back
+
+            if next_state is state:
+                await wait_for_event(state)
+
+            state = next_state
+
+        except asyncio.CancelledError:
+            raise
+
+        except Exception:
+            if restart is None:
+                raise
+
+            if state is None:
+                logging.exception(f"MACHINE: station {station} cannot start over")
+            else:
+                logging.exception(f"MACHINE: station {station} failed in {type(state).__name__}, starting over")
+                scheduler.cancel_owner(state)
 
-    sleep(.001)
+            state = None
 
-    return (gpio.input(button) == state) and state
+            await asyncio.sleep(RESTART_DELAY)
@@ -5,9 +5,46 @@ Configuration file that holds settings
 
 
 from Spalek.common import strings
+import os
 
 
 backToIdle_timeout = 2
+splash_time = 5                 # Seconds the hostname and IP address are shown after start-up
+button_sample_interval = .005   # Seconds between two samples of the buttons
+button_debounce = .02           # Seconds a button has to be stable before a press or release is reported
+tag_repeat_window = 5           # Seconds a card has to be away from the reader before it is read again
 timeout = 2                     # Request timeout
+api_pool_size = 4               # Connections kept open to the server
+breaker_failures = 3            # Consecutive failed calls after which calls fail at once
+breaker_reset = 5               # Seconds before a call is let through to probe the server again
+breaker_reset_max = 60          # Longest wait between two probes
+api_cache_size = 128            # Responses kept with their ETag/Last-Modified for conditional requests
+probe_path = "/"                # Requested with HEAD to keep a connection warm, None to disable the prober
+probe_interval = 20             # Seconds between two probes while the server is idle
+probe_interval_offline = 5      # Seconds between two probes while the server is unreachable
+projects_page_size = 20         # Projects requested per page, the next page is fetched while scrolling
+tag_cache_size = 256            # Number of tag owners kept in memory
+tag_cache_ttl = 24 * 3600       # Seconds a cached tag owner is trusted
+data_dir = os.environ.get("SPALEK_DATA_DIR", "/root/Python/Spalek")      # Log, caches and journal
+tag_cache_file = os.path.join(data_dir, "tags.json")        # Snapshot of the tag cache, None to disable
+tag_cache_save_delay = 10       # Seconds changes to the tag cache are gathered before its snapshot is written
+journal_file = os.path.join(data_dir, "journal.jsonl")      # Punches waiting to be sent to the server
+journal_retry_min = 1           # Seconds before the first retry of a failed punch
+journal_retry_max = 60          # Longest wait between retries
+journal_time_attribute = None   # Attribute the local punch time is sent in, None if the server stamps punches itself
+allowlist_file = os.path.join(data_dir, "tags.idx")     # Index of the valid tags, None to ask the server about every tag
+allowlist_refresh = 60          # Seconds between two syncs of the tags changed on the server
+allowlist_rebuild = 24 * 3600   # Seconds between two full syncs, which drop the removed tags
+allowlist_max_age = 3600        # Seconds after the last successful sync the index stops rejecting tags
+trace_buffer_size = 4096        # Spans kept in memory, 0 disables tracing
+trace_file = os.path.join(data_dir, "trace.json")   # Written on SIGUSR1 (JSON with statistics) or SIGUSR2 (Chrome trace)
+log_file = os.path.join(data_dir, "log.txt")
 serverIP = "http://172.16.20.15/dbapi/v2/spaleck"
 locale = strings.RO_            # Language
+
+# Stations served by this board: name, serial port of the RDM6300, I2C address
+# of the LCD and pins of the left, middle and right buttons (older boxes used PA20, PA14, PA10)
+
+stations = [
+    ("main", "/dev/ttyS1", 0x27, "PA16", "PA14", "PA15"),
+]
@@ -0,0 +1,261 @@
+"""
+This file holds the journal of punches waiting to be sent to the server
+
+"""
+
+
+from collections import deque
+from concurrent.futures import Future
+from datetime import datetime
+from time import sleep
+from uuid import uuid4
+import threading, json, os, logging
+
+from Spalek.common import config
+from Spalek.common.lazy import LazyModule
+from Spalek.common.breaker import CircuitOpenError
+
+
+requests = LazyModule("requests")
+
+
+class Journal(object):
+    """
+    Durable append-only journal of Assign/Unassign calls
+
+    Punches are written to the journal file and confirmed to the user once they
+    are on disk, then a background thread replays them to the API in order. A punch
+    is acknowledged in the journal once the server answered it, so entries left
+    over after a restart are sent again
+
+    A writer thread owns the file: the records handed to it while it is busy are
+    written together and made durable with a single fsync (group commit), so the
+    stations never wait on each other's writes, nor hold a lock across an fsync
+
+    File format: one JSON record per line, either a punch
+    {"seq", "key", "time", "method", "path", "data"} or an acknowledgement {"ack": seq}
+
+    """
+
+
+    def __init__(self, path, client):
+        """
+        Parameters
+        ----------
+
+        path : string
+            Journal file, created if missing
+
+        client : ApiClient
+            Client the punches are replayed with
+
+        """
+
+        self.path = path
+
+        self.__client = client
+        self.__lock = threading.Condition()     # Guards the punches waiting for the replayer
+        self.__pending = deque()
+        self.__queue = []                       # (record, Future or None) waiting for the writer
+        self.__queue_lock = threading.Condition()
+        self.__seq = 0
+        self.__thread = None
+
+        self.__load()
+
+        self.__file = open(path, "a")
+
+        threading.Thread(target = self.__writer, name = "journal-writer", daemon = True).start()
+
+
+    def __len__(self):
+        """
+        Number of punches not yet accepted by the server
+
+        """
+
+        return len(self.__pending)
+
+
+    def __load(self):
+        """
+        Reads the punches that were not acknowledged before the last shutdown
+
+        """
+
+        entries = []
+        acked = set()
+
+        try:
+            with open(self.path) as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue        # Torn write at power loss
+
+                    if "ack" in record:
+                        acked.add(record["ack"])
+                    else:
+                        entries.append(record)
+                        self.__seq = max(self.__seq, record["seq"])
+
+        except FileNotFoundError:
+            return
+
+        self.__pending.extend(e for e in entries if e["seq"] not in acked)
+
+
+    def __enqueue(self, record, future = None):
+        with self.__queue_lock:
+            self.__queue.append((record, future))
+            self.__queue_lock.notify()
+
+
+    def __writer(self):
+        """
+        Writes the queued records in batches, with one fsync per batch
+
+        """
+
+        while True:
+            with self.__queue_lock:
+                while not self.__queue:
+                    self.__queue_lock.wait()
+
+                batch, self.__queue = self.__queue, []
+
+            punches = [(record, future) for record, future in batch if future is not None]
+
+            try:
+                for record, _ in batch:
+                    self.__file.write(json.dumps(record) + "\n")
+
+                self.__file.flush()
+
+                # Acknowledgements are made durable too: one lost at power loss would make a
+                # punch be sent again, and the server does not recognise a repeated POST
+
+                os.fsync(self.__file.fileno())
+
+            except OSError as e:
+                logging.warning("JOURNAL: " + str(e))
+
+                for _, future in punches:
+                    future.set_exception(e)
+
+                continue
+
+            with self.__lock:
+                self.__pending.extend(record for record, _ in punches)
+
+                # Everything was sent, start over with an empty file; only this thread writes it
+
+                if not self.__pending:
+                    self.__file.truncate(0)
+
+                self.__lock.notify()
+
+            for record, future in punches:
+                future.set_result(record)
+
+
+    def append(self, method, path, data):
+        """
+        Records a punch, which is replayed once it is durable
+
+        Returns :
+            A concurrent.futures.Future of the journal entry, done once the entry is
+            fsynced, together with the other punches appended meanwhile
+
+        Raises (from the future) :
+            OSError if the journal cannot be written
+
+        """
+
+        future = Future()
+
+        with self.__queue_lock:
+            self.__seq += 1
+
+            entry = {
+                "seq": self.__seq,
+                "key": uuid4().hex,
+                "time": datetime.now().isoformat(timespec = "seconds"),
+                "method": method,
+                "path": path,
+                "data": data
+            }
+
+        self.__enqueue(entry, future)
+
+        return future
+
+
+    def start(self):
+        """
+        Starts the background replayer
+
+        """
+
+        if self.__thread is None:
+            self.__thread = threading.Thread(target = self.__replay, name = "journal", daemon = True)
+            self.__thread.start()
+
+
+    def __send(self, entry):
+        """
+        Sends a punch to the server
+
+        Returns :
+            True if the server gave a final answer, False if the punch has to be retried
+
+        """
+
+        data = entry["data"]
+
+        if config.journal_time_attribute is not None:
+            data = json.loads(json.dumps(data))
+            data["data"]["attributes"][config.journal_time_attribute] = entry["time"]
+
+        try:
+            # The key lets a server that supports it ignore a punch it already received
+
+            resp = self.__client.request(entry["method"], entry["path"], data, headers = {"Idempotency-Key": entry["key"]})
+
+        except (requests.RequestException, CircuitOpenError) as e:
+            logging.info("JOURNAL: " + str(e))
+            return False
+
+        if resp.status_code >= 500:
+            logging.warning(f"JOURNAL: {entry['method']} {entry['path']} returned {resp.status_code}, retrying")
+            return False
+
+        if resp.status_code >= 400:
+            logging.warning(f"JOURNAL: {entry['method']} {entry['path']} from {entry['time']} rejected with {resp.status_code}")
+
+        return True
+
+
+    def __replay(self):
+        delay = 0
+
+        while True:
+            with self.__lock:
+                while not self.__pending:
+                    self.__lock.wait()
+
+                entry = self.__pending[0]
+
+            if not self.__send(entry):
+                delay = min(max(delay * 2, config.journal_retry_min), config.journal_retry_max)
+                sleep(delay)
+
+                continue
+
+            delay = 0
+
+            with self.__lock:
+                self.__pending.popleft()
+
+            self.__enqueue({"ack": entry["seq"]})
@@ -0,0 +1,24 @@
+"""
+This file holds a proxy that imports a module the first time it is used
+
+"""
+
+
+import importlib
+
+
+class LazyModule(object):
+    """
+    Stands in for a module that is slow to import, e.g. requests on the Orange Pi
+
+    The module is imported on the first attribute access, so importing the
+    program does not pay for it and a warm-up thread can load it in the background
+
+    """
+
+    def __init__(self, name):
+        self.__name = name
+
+
+    def __getattr__(self, attr):
+        return getattr(importlib.import_module(self.__name), attr)
@@ -0,0 +1,189 @@
+"""
+This file holds the records of the API the states work with
+
+Each response is decoded once into these slotted classes, which keep only the
+fields the box uses, and the states pass them to each other
+
+"""
+
+
+def decode(document, model):
+    """
+    Decodes the primary data of a JSON:API document
+
+    Parameters
+    ----------
+
+    document : dict
+        Decoded body of the response
+
+    model : class
+        Class of the records, with a from_json() class method
+
+    Returns :
+        A list of records for a collection, a single record, or None if the document has no data
+
+    """
+
+    data = document.get("data")
+
+    if data is None:
+        return None
+
+    if isinstance(data, list):
+        return [model.from_json(record) for record in data]
+
+    return model.from_json(data)
+
+
+class Tag(object):
+    """
+    A tag and the employee it belongs to
+
+    """
+
+    __slots__ = ("id", "fname", "lname")
+
+
+    def __init__(self, id, fname, lname):
+        self.id = id
+        self.fname = fname
+        self.lname = lname
+
+
+    @classmethod
+    def from_json(cls, record):
+        attributes = record["attributes"]
+
+        return cls(record["id"], attributes["fname"], attributes["lname"])
+
+
+    @property
+    def display_name(self):
+        """
+        Initial and last name, as shown in the header of the menus
+
+        """
+
+        return f"{self.fname[0]}. {self.lname}"[0: 19]
+
+
+class AllocOrder(object):
+    """
+    An operation of an order the employee can start working on
+
+    """
+
+    __slots__ = ("id", "fname", "lname", "emplid", "order_id", "order_name", "op_id", "op_name", "hourlyrate", "currency")
+
+
+    def __init__(self, id, order_name, op_name, order_id = None, op_id = None, emplid = None,
+                 fname = "", lname = "", hourlyrate = None, currency = None):
+        self.id = id
+        self.order_name = order_name
+        self.op_name = op_name
+        self.order_id = order_id
+        self.op_id = op_id
+        self.emplid = emplid
+        self.fname = fname
+        self.lname = lname
+        self.hourlyrate = hourlyrate
+        self.currency = currency
+
+
+    @classmethod
+    def from_json(cls, record):
+        attributes = record["attributes"]
+
+        return cls(
+            record["id"],
+            attributes["order_name"],
+            attributes["op_name"],
+            order_id = int(attributes["order_id"]),
+            op_id = int(attributes["op_id"]),
+            emplid = int(attributes["emplid"]),
+            fname = attributes["fname"],
+            lname = attributes["lname"],
+            hourlyrate = attributes["hourlyrate"],
+            currency = attributes["currency"]
+        )
+
+
+    @property
+    def display_name(self):
+        return f"{self.fname[0]}. {self.lname}"[0: 19]
+
+
+    @property
+    def display_text(self):
+        """
+        Order and operation names, as shown in the menus
+
+        """
+
+        text = self.order_name
+
+        if self.op_name:
+            text += " " + self.op_name
+
+        return text[0: 16]
+
+
+    def start_work(self):
+        """
+        Document of the request that starts working on this operation
+
+        """
+
+        return {
+            "data": {
+                "type": "timetracking",
+                "attributes": {
+                    "hourly_rate": self.hourlyrate,
+                    "employee": self.emplid,
+                    "operation": self.op_id,
+                    "order": self.order_id,
+                    "currency": self.currency
+                }
+            }
+        }
+
+
+class TimetrackingEntry(object):
+    """
+    Work running on an operation
+
+    """
+
+    __slots__ = ("id", "order_label", "operation_name", "worktime")
+
+
+    def __init__(self, id, order_label, operation_name, worktime):
+        self.id = id
+        self.order_label = order_label
+        self.operation_name = operation_name
+        self.worktime = worktime
+
+
+    @classmethod
+    def from_json(cls, record):
+        attributes = record["attributes"]
+
+        return cls(record["id"], attributes["order_label"], attributes["operation_name"], attributes["worktime"])
+
+
+    def stop_work(self):
+        """
+        Document of the request that ends this work
+
+        """
+
+        return {
+            "data": {
+                "id": self.id,
+                "type": "timetracking",
+                "attributes": {
+                    "status": "f"
+                }
+            }
+        }
@@ -0,0 +1,210 @@
+"""
+This file holds the view of the API's paginated collections, e.g. the projects of a tag
+
+"""
+
+
+from concurrent.futures import CancelledError
+import asyncio, logging
+
+from Spalek.common import config
+from Spalek.common.models import decode
+
+
+def page_path(path, number, size = config.projects_page_size):
+    """
+    Path of a page of a JSON:API collection, path may already have a query
+
+    """
+
+    separator = "&" if "?" in path else "?"
+
+    return f"{path}{separator}page[number]={number}&page[size]={size}"
+
+
+class PagedList(object):
+    """
+    Records of a paginated collection, fetched page by page as they are needed
+
+    The first page is requested as soon as the list is created. The following ones are
+    requested one page ahead of the reader with read_ahead(), so scrolling rarely waits
+    on the network. A collection is complete when a page has no "next" link, which is
+    also the case when the server does not paginate and returns everything at once
+
+    Pages are conditional requests, so a page that did not change since it was last
+    seen is not sent again and its records are not decoded again
+
+    """
+
+
+    def __init__(self, client, path, model, page_size = config.projects_page_size):
+        """
+        Parameters
+        ----------
+
+        client : ApiClient
+            Client the pages are requested with
+
+        path : string
+            Path of the collection, e.g. "/tags/0001234567/alloc_orders"
+
+        model : class
+            Class the records are decoded to, e.g. AllocOrder
+
+        page_size : int
+            Records requested per page
+
+        """
+
+        self.__client = client
+        self.__path = path
+        self.__model = model
+        self.__page_size = page_size
+
+        self.__items = []
+        self.__number = 1           # Number of the next page to request
+        self.__complete = False
+        self.__pending = None       # Future of the page being fetched
+
+        self.__request()
+
+
+    def __len__(self):
+        return len(self.__items)
+
+
+    def __getitem__(self, index):
+        return self.__items[index]
+
+
+    @property
+    def complete(self):
+        """
+        True once all the records were loaded
+
+        """
+
+        return self.__complete
+
+
+    def __request(self):
+        self.__pending = self.__client.get_cached_async(page_path(self.__path, self.__number, self.__page_size), self.__decode)
+        self.__number += 1
+
+
+    def __decode(self, document):
+        """
+        Returns :
+            The records of a page and whether there is a next page
+
+        """
+
+        return decode(document, self.__model) or [], bool((document.get("links") or {}).get("next"))
+
+
+    def __take(self, resp):
+        """
+        Appends the records of a page
+
+        Returns :
+            The status code of the response
+
+        """
+
+        if resp.decoded is None:
+            self.__complete = True
+            return resp.status_code
+
+        data, more = resp.decoded
+
+        self.__items.extend(data)
+
+        # An empty page also ends the list, so a reader waiting for more records always makes progress
+
+        self.__complete = not data or not more
+
+        return resp.status_code
+
+
+    async def load(self):
+        """
+        Waits for the page being fetched and appends its records
+
+        Returns :
+            The status code of the response
+
+        Raises :
+            requests exceptions on connection errors and timeouts
+
+        """
+
+        future = self.__pending
+        self.__pending = None
+
+        return self.__take(await asyncio.wrap_future(future))
+
+
+    def read_ahead(self, index):
+        """
+        Starts fetching the next page once the record at `index` is on the last loaded page
+
+        """
+
+        if self.__complete or self.__pending is not None:
+            return
+
+        if index >= len(self.__items) - self.__page_size:
+            self.__request()
+
+
+    def poll(self):
+        """
+        Appends the page fetched in the background, if it arrived
+
+        A page that cannot be loaded ends the list, so the records loaded so far can still be used
+
+        """
+
+        future = self.__pending
+
+        if future is None or not future.done():
+            return
+
+        self.__pending = None
+
+        try:
+            if self.__take(future.result()) not in (200, 202, 304):
+                self.__complete = True
+
+        except (Exception, CancelledError) as e:
+            logging.warning(f"PAGES: {self.__path} page {self.__number - 1}: {e!r}")
+
+            self.__complete = True
+
+
+    async def load_more(self):
+        """
+        Waits for the next page, requesting it if needed
+
+        """
+
+        if self.__complete:
+            return
+
+        if self.__pending is None:
+            self.__request()
+
+        await asyncio.wait([asyncio.wrap_future(self.__pending)])
+
+        self.poll()
+
+
+    def cancel(self):
+        """
+        Drops the page being fetched, when the list is not needed anymore
+
+        """
+
+        if self.__pending is not None:
+            self.__pending.cancel()
+            self.__pending = None
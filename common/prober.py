@@ -0,0 +1,139 @@
+"""
+This file holds the background prober that keeps a connection to the server warm and tracks its health
+
+"""
+
+
+from time import monotonic, sleep
+import threading, logging
+
+from Spalek.common import config
+from Spalek.common.lazy import LazyModule
+from Spalek.common.breaker import CircuitBreaker, CircuitOpenError
+from Spalek.common.api import GATEWAY_ERRORS
+
+
+requests = LazyModule("requests")
+
+
+class Prober(object):
+    """
+    Makes a cheap call to the server every config.probe_interval seconds while it is idle
+
+    The call goes through the pooled session of the client, so the first tap after a
+    long idle period finds the name resolved and a TCP connection open, and the server
+    path warm; while the server is down the probes are made every config.probe_interval_offline
+    seconds and act as the half-open probes of the circuit breaker
+
+    A probe is skipped while the client has calls in flight or if one was answered
+    during the interval, so it never competes with the calls of the states. It has
+    the timeout of the other calls, and its failures never count toward opening the
+    circuit breaker, so a slow but working server is not taken for a down one
+
+    ...
+    Attributes
+    ----------
+    online : bool
+        False if the last call failed or the circuit breaker is open, shown on the Idle screen
+
+    rtt : float
+        Smoothed round trip time of the probes in seconds, None before the first answer
+
+    """
+
+    SMOOTHING = .2      # Weight of the last probe in rtt
+
+
+    def __init__(self, client, path = config.probe_path):
+        """
+        Parameters
+        ----------
+
+        client : ApiClient
+            Client whose connections are kept warm
+
+        path : string
+            Path requested with HEAD, None to disable the prober
+
+        """
+
+        self.path = path
+        self.rtt = None
+
+        self.__client = client
+        self.__thread = None
+        self.__reachable = True     # Result of the last probe; unknown before the first one
+
+
+    @property
+    def online(self):
+        return self.__reachable and self.__client.breaker.state != CircuitBreaker.OPEN
+
+
+    def probe(self):
+        """
+        Makes a probe and updates online and rtt
+
+        Returns :
+            True if the server answered
+
+        """
+
+        started = monotonic()
+
+        try:
+            resp = self.__client.request("HEAD", self.path, probe = True)
+
+        except (requests.RequestException, CircuitOpenError) as e:
+            if self.__reachable:
+                logging.warning("PROBER: server offline, " + str(e))
+
+            self.__reachable = False
+            return False
+
+        # Any status counts as reachable, unless the gateway reports the server down
+
+        reachable = resp.status_code not in GATEWAY_ERRORS
+
+        if reachable:
+            rtt = monotonic() - started
+            self.rtt = rtt if self.rtt is None else self.rtt + self.SMOOTHING * (rtt - self.rtt)
+
+        if reachable != self.__reachable:
+            logging.warning(f"PROBER: server {'online' if reachable else 'offline'}")
+
+        self.__reachable = reachable
+        return reachable
+
+
+    def start(self):
+        """
+        Starts the background probes
+
+        """
+
+        if self.path is not None and self.__thread is None:
+            self.__thread = threading.Thread(target = self.__run, name = "prober", daemon = True)
+            self.__thread.start()
+
+
+    def __run(self):
+        probed = 0      # monotonic() time of the last probe
+
+        while True:
+            sleep(config.probe_interval_offline)
+
+            # A call of the states kept the connection warm and showed the server is up
+
+            answered = self.__client.last_success
+
+            if answered is not None and answered > probed and self.__client.breaker.state == CircuitBreaker.CLOSED:
+                self.__reachable = True
+
+            interval = config.probe_interval if self.online else config.probe_interval_offline
+
+            if monotonic() - max(probed, answered or 0) < interval or self.__client.in_flight:
+                continue
+
+            self.probe()
+            probed = monotonic()
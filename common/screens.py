@@ -0,0 +1,50 @@
+"""
+This file holds the screens of the user interface, compiled once for the active locale
+
+"""
+
+
+from functools import lru_cache
+
+from Spalek.util.lcd_driver import compile_line
+from Spalek.common import config
+
+
+@lru_cache(maxsize = 64)
+def message(msg):
+    """
+    Compiles a message shown centered starting from the second line
+
+    Parameters
+    ----------
+
+    msg : string
+        message text, lines are separated by "\\n"
+
+    Returns :
+        The four compiled lines of the screen, empty lines are left untouched when printed
+
+    """
+
+    lines = [b"", b"", b"", b""]
+
+    for i, line in enumerate(msg.split("\n")[0: 3]):
+        lines[1 + i] = compile_line(f"{line:^20}")
+
+    return tuple(lines)
+
+
+BLANK_LINE = compile_line(" " * 20)
+IDLE_FOOTER = compile_line(f"{'Spaleck': >20}")
+IDLE_FOOTER_OFFLINE = compile_line(f"&4&{'Spaleck': >19}")
+ACCEPT_FOOTER = compile_line(f"OK{config.locale['BACK']: >18}")
+SELECT_FOOTER = compile_line("OK                 &2&")
+# SELECT_FOOTER = compile_line("OK       &3&         &2&")
+END_WORK_FOOTER = compile_line(f"Stop{config.locale['BACK']: >16}")
+
+PROCESSING = message(config.locale["PROC"])
+
+# Precompile every message of the active locale
+
+for text in config.locale.values():
+    message(text)
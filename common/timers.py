@@ -0,0 +1,166 @@
+"""
+Timer scheduler of the state machine
+
+Deadlines are kept on the monotonic clock in a heap, so they are not affected by
+changes of the wall clock (NTP, RTC sync) and the main loop can sleep exactly until
+the next one
+
+"""
+
+
+from time import monotonic
+import heapq, itertools
+
+
+class Timer(object):
+    """
+    A callback scheduled on the monotonic clock
+
+    ...
+    Attributes
+    ----------
+    deadline : float
+        monotonic() time the callback is due at
+
+    interval : float
+        Period of a periodic timer, or None for a one-shot timer
+
+    owner : object
+        The state that registered the timer; its timers are cancelled when it is left
+
+    """
+
+    __slots__ = ("deadline", "interval", "callback", "owner", "cancelled")
+
+
+    def __init__(self, deadline, interval, callback, owner):
+        self.deadline = deadline
+        self.interval = interval
+        self.callback = callback
+        self.owner = owner
+        self.cancelled = False
+
+
+    def cancel(self):
+        self.cancelled = True
+
+
+    def remaining(self):
+        return self.deadline - monotonic()
+
+
+class Scheduler(object):
+    """
+    Heap of timers, run by the main loop
+
+    Cancelled timers stay in the heap until they reach its top, so cancelling is O(1)
+
+    """
+
+    def __init__(self):
+        self.__heap = []
+        self.__seq = itertools.count()      # Keeps timers due at the same time in order
+
+
+    def __push(self, timer):
+        heapq.heappush(self.__heap, (timer.deadline, next(self.__seq), timer))
+
+
+    def call_later(self, delay, callback, interval = None, owner = None):
+        """
+        Schedules callback() in `delay` seconds, then every `interval` seconds if given
+
+        Returns :
+            The Timer, which can be cancelled
+
+        """
+
+        timer = Timer(monotonic() + delay, interval, callback, owner)
+        self.__push(timer)
+
+        return timer
+
+
+    def cancel_owner(self, owner):
+        """
+        Cancels all the timers registered by owner
+
+        """
+
+        for _, _, timer in self.__heap:
+            if timer.owner is owner:
+                timer.cancelled = True
+
+
+    def next_deadline(self, owner = None):
+        """
+        monotonic() time of the next timer, or None if no timer is scheduled
+
+        With an owner, only its timers are considered, so the state machine of a
+        station does not wake up on the timers of the other stations
+
+        """
+
+        heap = self.__heap
+
+        while heap and heap[0][2].cancelled:
+            heapq.heappop(heap)
+
+        if owner is None:
+            return heap[0][0] if heap else None
+
+        return min((timer.deadline for _, _, timer in heap if timer.owner is owner and not timer.cancelled), default = None)
+
+
+    def timeout(self, owner = None):
+        """
+        Seconds until the next timer (of owner, if given) is due, or None if no timer is scheduled
+
+        """
+
+        deadline = self.next_deadline(owner)
+
+        if deadline is None:
+            return None
+
+        return max(0, deadline - monotonic())
+
+
+    def run_due(self):
+        """
+        Calls the callbacks of the timers that are due
+
+        A periodic timer that fell behind skips the missed ticks instead of firing them back to back
+
+        Returns :
+            The number of callbacks called
+
+        """
+
+        heap = self.__heap
+        now = monotonic()
+        count = 0
+
+        while heap and heap[0][0] <= now:
+            _, _, timer = heapq.heappop(heap)
+
+            if timer.cancelled:
+                continue
+
+            if timer.interval is not None:
+                timer.deadline += timer.interval
+
+                if timer.deadline <= now:
+                    timer.deadline = now + timer.interval
+
+                self.__push(timer)
+            else:
+                timer.cancelled = True
+
+            timer.callback()
+            count += 1
+
+        return count
+
+
+scheduler = Scheduler()
@@ -0,0 +1,169 @@
+"""
+This file holds the tracer that records how long each step of the program takes
+
+"""
+
+
+from collections import deque
+from time import perf_counter
+import threading, json, functools
+
+from Spalek.common import config
+
+
+class Span(object):
+    """
+    Times a block of code and records it in the tracer when the block ends
+
+    """
+
+    __slots__ = ("tracer", "name", "category", "args", "start")
+
+
+    def __init__(self, tracer, name, category, args):
+        self.tracer = tracer
+        self.name = name
+        self.category = category
+        self.args = args
+
+
+    def __enter__(self):
+        self.start = perf_counter()
+
+        return self
+
+
+    def __exit__(self, *exc):
+        self.tracer.record(self.name, self.category, self.start, perf_counter() - self.start, self.args)
+
+
+class Tracer(object):
+    """
+    Keeps the latest spans in a fixed-size ring buffer in memory
+
+    Recording never touches the disk; the buffer is written only when dump() is called
+
+    """
+
+
+    def __init__(self, size = 4096):
+        """
+        Parameters
+        ----------
+
+        size : int
+            Number of spans kept, the oldest ones are dropped first. 0 disables tracing
+
+        """
+
+        self.enabled = size > 0
+        self.__spans = deque(maxlen = max(size, 1))       # (name, category, start, duration, thread, args)
+
+
+    def span(self, name, category = "state", **args):
+        """
+        Returns :
+            A context manager timing the block it wraps
+
+        """
+
+        return Span(self, name, category, args)
+
+
+    def wrap(self, function, name, category = "state"):
+        """
+        Returns :
+            The function, recording a span each time it is called
+
+        """
+
+        @functools.wraps(function)
+        def traced(*args, **kwargs):
+            with Span(self, name, category, None):
+                return function(*args, **kwargs)
+
+        return traced
+
+
+    def record(self, name, category, start, duration, args = None):
+        if self.enabled:
+            self.__spans.append((name, category, start, duration, threading.get_ident(), args))
+
+
+    def clear(self):
+        self.__spans.clear()
+
+
+    def stats(self):
+        """
+        Latency percentiles of every span name in the buffer
+
+        Returns :
+            {name: {"count", "p50", "p90", "p99", "max"}}, durations in milliseconds
+
+        """
+
+        durations = {}
+
+        for name, _, _, duration, _, _ in list(self.__spans):
+            durations.setdefault(name, []).append(duration * 1000)
+
+        result = {}
+
+        for name, values in durations.items():
+            values.sort()
+
+            result[name] = {
+                "count": len(values),
+                "p50": values[int(len(values) * .5)],
+                "p90": values[int(len(values) * .9)],
+                "p99": values[int(len(values) * .99)],
+                "max": values[-1]
+            }
+
+        return result
+
+
+    def to_json(self):
+        """
+        Returns :
+            The spans, times in milliseconds, and their statistics
+
+        """
+
+        return {
+            "spans": [
+                {"name": name, "cat": category, "start": start * 1000, "dur": duration * 1000, "thread": thread, "args": args or {}}
+                for name, category, start, duration, thread, args in list(self.__spans)
+            ],
+            "stats": self.stats()
+        }
+
+
+    def to_chrome_trace(self):
+        """
+        Returns :
+            The spans in the Chrome trace event format, loadable in chrome://tracing or Perfetto
+
+        """
+
+        return {
+            "traceEvents": [
+                {"name": name, "cat": category, "ph": "X", "ts": start * 1000000, "dur": duration * 1000000, "pid": 1, "tid": thread, "args": args or {}}
+                for name, category, start, duration, thread, args in list(self.__spans)
+            ],
+            "displayTimeUnit": "ms"
+        }
+
+
+    def dump(self, path, chrome = False):
+        """
+        Writes the buffer to a file, as JSON with statistics or as a Chrome trace
+
+        """
+
+        with open(path, "w") as f:
+            json.dump(self.to_chrome_trace() if chrome else self.to_json(), f)
+
+
+tracer = Tracer(config.trace_buffer_size)
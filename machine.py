@@ -4,15 +4,22 @@ This file contains the definitions of the state machine's states
 """
 
 
-from Spalek.util.tag_reader import RDM6300
+from Spalek.common.code import State
+from Spalek.common.lazy import LazyModule
+from Spalek.common.breaker import CircuitOpenError
+from Spalek.common.api import GATEWAY_ERRORS
+from Spalek.common.pages import PagedList
+from Spalek.common.models import decode, Tag, AllocOrder, TimetrackingEntry
+from Spalek.common import config, screens
 
-from Spalek.common.code import State, read
-from Spalek.common import config
-
-from Spalek.__global_var import lcd, left_button, right_button, middle_button
+from Spalek.__global_var import api, tags, allowlist, journal, prober
 
+from functools import partial
 from datetime import datetime
-import requests, logging, json
+import logging, asyncio
+
+
+requests = LazyModule("requests")     # Only needed once a tag is read, see main/main.py
 
 
 class Idle(State):
@@ -33,30 +40,51 @@ class Idle(State):
     """
 
 
-    def __init__(self):
+    def __init__(self, station, splash = None):
         """
-        Initilizes tag reader with the /dev/ttyS1 serial port and a baud rate of 9600 BPS
+        Starts waiting for a tag on the station's reader, tags read in the other states are discarded
 
         Timeout after 30 seconds
 
+        Parameters
+        ----------
+
+        station : Station
+            Hardware of the station, passed on to the following states
+
+        splash : list
+            Two lines (e.g. hostname and IP address) shown instead of the footer for
+            config.splash_time seconds; tags are accepted meanwhile
+
         """
 
-        lcd.clear()
+        self.station = station
 
-        self.__reader = RDM6300('/dev/ttyS1', 9600)
+        self.station.lcd.clear()
+
+        self.__reader = station.reader
         self.__reader.readTag()
 
         self.__dots = 0
         self.__fillChar = "."
-        self.__last_update = datetime.now()
+        self.__display_on = True
+        self.__splash = splash
 
         super().__init__(30)
 
+        self.__animation = self.every(.9, self.__animate)
+        self.__clock = self.after(self.__next_second(), self.__tick)
+
+        if splash is not None:
+            self.after(config.splash_time, self.__hide_splash)
+
 
     def run(self):
         """
         Print current date and time on first line, a message on line 2 and a footer on line 4
 
+        While the splash is shown, it replaces lines 3 and 4; the footer is marked while the server is offline
+
         """
 
         try:
@@ -68,44 +96,73 @@ class Idle(State):
             logging.warning("TAG_READER: " + str(e))
             self.__reader.readTag()
 
-        footer = "Spaleck"
+        if not self.__display_on:
+            return "WAIT"
+
+        if self.__splash is not None:
+            footer = [f"{self.__splash[0]:20}", f"{self.__splash[1]:20}"]
+        else:
+            footer = [screens.BLANK_LINE, screens.IDLE_FOOTER if prober.online else screens.IDLE_FOOTER_OFFLINE]
 
-        lcd.Print([
+        self.station.lcd.Print([
             datetime.now().strftime("%a, %d.%m  %H:%M:%S"),
-            f"{config.locale['SCAN']}" + self.__fillChar * self.__dots,
-            "",
-            f"{footer: >20}"
-        ])
+            f"{config.locale['SCAN']}" + self.__fillChar * self.__dots
+        ] + footer)
+
+        return "WAIT"
+    
 
-        if (datetime.now() - self.__last_update).seconds >= .9:
-            self.__dots += 1
+    def waitables(self):
+        return [self.__reader]
 
-            if self.__dots > 4:
-                if self.__fillChar == " ":
-                    self.__fillChar = "."
-                    self.__dots = 1
-                else:
-                    self.__fillChar = " "
-                    self.__dots = 4
 
-            self.__last_update = datetime.now()
+    @staticmethod
+    def __next_second():
+        return 1 - datetime.now().microsecond / 1000000
+
+
+    def __tick(self):
+        """
+        Wakes the main loop on every second of the wall clock, so the clock is redrawn
+
+        """
+
+        self.__clock = self.after(self.__next_second(), self.__tick)
+
+
+    def __animate(self):
+        self.__dots += 1
+
+        if self.__dots > 4:
+            if self.__fillChar == " ":
+                self.__fillChar = "."
+                self.__dots = 1
+            else:
+                self.__fillChar = " "
+                self.__dots = 4
+
+
+    def __hide_splash(self):
+        self.__splash = None
 
-        return "WAIT"
-    
 
     def on_event(self, e):
         if e == "TIME_OUT":
-            lcd.switchOff()
+            self.station.lcd.switchOff()
 
-            return self
+            self.__display_on = False
 
-        if e == "OK":
-            lcd.switchOn()
-            id = self.__reader.tagID
+            # Nothing to redraw until the next tag
 
-            del self.__reader
+            self.cancel_timeout()
+            self.__clock.cancel()
+            self.__animation.cancel()
 
-            return QueryTag(id)
+            return self
+
+        if e == "OK":
+            self.station.lcd.switchOn()
+            return QueryTag(self.station, self.__reader.tagID)
         return self
 
 
@@ -116,7 +173,7 @@ class QueryTag(State):
     Events
     ==============
         "TIME_OUT" : Request timed out, calls BackToIdle with the corresponding message
-        "CONN_ERR" : Connection error: server unreachable or error occurred during processing
+        "CONN_ERR" : Connection error: server unreachable or error occurred during processing, or server known to be down
 
         Otherwise checks status code and responds appropriately
     
@@ -124,139 +181,206 @@ class QueryTag(State):
     ==============
         200 : A project was assigned, calls EndWork to end it
         202 : No project is assigned, calls QueryProjects to get a list of assignable projects
+        304 : Status unchanged since the last call, handled like the cached 200 or 202
         404 : Invalid or unrecognised tag
-        500 : Internal server error
+        502, 503, 504 : Server down behind its gateway, handled like "CONN_ERR"
+        Any other 4xx or 5xx : Handled like 500, internal server error
 
     """
 
-    def __init__(self, tagID):
-        lcd.clear()
-        lcd.PrintLine(f"{config.locale['PROC']:^20}", 2)
+    def __init__(self, station, tagID):
+        self.station = station
+
+        self.station.lcd.clear()
+        self.station.lcd.Print(screens.PROCESSING)
 
         self.__tagID = tagID
+        self.__projects = None
 
         super().__init__()
 
 
-    def run(self):
+    async def run(self):
         """
-        Makes a call to the API to get the status of the read tag
+        Makes concurrent calls to the API to get the owner and the status of the read tag
+
+        The owner is taken from the tag cache when possible, so only the status is requested.
+        The list of projects is requested at the same time, in case no project is running.
+        Tags missing from the allowlist are rejected right away
 
         """
 
         try:
-            resp = requests.get(f"{config.serverIP}/tags/{self.__tagID}", timeout=config.timeout)
+            owner = tags.get(self.__tagID)
 
-            if resp.status_code == 500:
-                return 500
+            # Unknown cards are rejected without asking the server
 
-            if resp.json()["data"] is None:
+            if owner is None and self.__tagID not in allowlist:
                 return "INVALID"
-            
-            # Tag is valid
 
-            fname = resp.json()["data"]["attributes"]["fname"]
-            lname = resp.json()["data"]["attributes"]["lname"]
+            if owner is None:
+                tag_req = api.get_async(f"/tags/{self.__tagID}")
 
-            self.__display_name = f"{fname[0]}. {lname}"[0: 19]
+            work_req = api.get_cached_async(f"/tags/{self.__tagID}/started_work", partial(decode, model = TimetrackingEntry))
+            self.__projects = PagedList(api, f"/tags/{self.__tagID}/alloc_orders", AllocOrder)
 
-            resp = requests.get(f"{config.serverIP}/tags/{self.__tagID}/started_work", timeout=config.timeout)
+            if owner is None:
+                resp = await asyncio.wrap_future(tag_req)
 
-            if resp.status_code == 500:
+                if resp.status_code in GATEWAY_ERRORS:
+                    return "CONN_ERR"
+
+                if resp.status_code == 404:
+                    return "INVALID"
+
+                if resp.status_code >= 400:
+                    return 500
+
+                tag = decode(resp.json(), Tag)
+
+                if tag is None:
+                    return "INVALID"
+
+                # Tag is valid
+
+                tags.put(self.__tagID, {"fname": tag.fname, "lname": tag.lname})
+            else:
+                tag = Tag(self.__tagID, owner["fname"], owner["lname"])
+
+            self.__display_name = tag.display_name
+
+            resp = await asyncio.wrap_future(work_req)
+
+            if resp.status_code in GATEWAY_ERRORS:
+                return "CONN_ERR"
+
+            if resp.status_code == 404:
+                # The tag was removed since it was cached
+
+                tags.invalidate(self.__tagID)
+                return "INVALID"
+
+            # An error status must not be taken for "no work running"
+
+            if resp.status_code >= 400:
                 return 500
-            
-            return resp.json()["data"]
 
-        except requests.exceptions.ConnectTimeout:
+            return resp.decoded
+
+        except requests.Timeout:
             return "TIME_OUT"
         
-        except requests.ConnectionError:
+        except (requests.ConnectionError, CircuitOpenError):
             return "CONN_ERR"
 
 
     def on_event(self, e):
+        if not e:
+            return QueryProjects(self.station, self.__tagID, self.__projects)
+
+        # The prefetched list of projects is not needed
+
+        if self.__projects is not None:
+            self.__projects.cancel()
+
         if e == "TIME_OUT":
-            return BackToIdle(config.locale["REQ_TO"])
+            return BackToIdle(self.station, config.locale["REQ_TO"])
 
         if e == "CONN_ERR":
-            return BackToIdle(config.locale["SRV_UNREACH"])
+            return BackToIdle(self.station, config.locale["SRV_UNREACH"])
         
         if e == "INVALID":
-            return BackToIdle(config.locale["INVALID"])
+            return BackToIdle(self.station, config.locale["INVALID"])
         
         if e == 500:
-            return BackToIdle(config.locale["SRV_INT"])
-            
-        if not e:
-            return QueryProjects(self.__tagID)
+            return BackToIdle(self.station, config.locale["SRV_INT"])
         
-        return EndWork(self.__tagID, e[0], self.__display_name)
+        return EndWork(self.station, self.__tagID, e[0], self.__display_name)
 
 
 class QueryProjects(State):
     """
-    Makes a call to the API to get a list of projects related to the tag.
+    Makes a call to the API to get the first page of the list of projects related to the tag.
 
     Events
     ==============
         "TIME_OUT" : Request timed out, return to Idle and display error message
-        "CONN_ERR" : Connection error: server unreachable or error occurred during processing
+        "CONN_ERR" : Connection error: server unreachable or error occurred during processing, or server known to be down
 
         Otherwise checks status code and responds appropriately    
     
     Status codes
     ==============
-        200 : OK, calls AcceptProject if there is only one record in the list, or passes the whole list to SelectProject
+        200 : OK, calls AcceptProject if there is only one record in the list, or passes the list to SelectProject
         202 : No assignable projects
         404 : Invalid or unrecognised tag - should not be able to reach this point after getting through QueryTag
-        500 : Internal server error
+        502, 503, 504 : Server down behind its gateway, handled like "CONN_ERR"
+        Any other 4xx or 5xx : Handled like 500, internal server error
 
     """
 
-    def __init__(self, tagID):
+    def __init__(self, station, tagID, projects = None):
+        """
+        Parameters
+        ----------
+
+        tagID : string
+            ID of the read tag
+
+        projects : PagedList
+            List of projects already requested by QueryTag, if any
+
+        """
+
+        self.station = station
+
         self.__tagID = tagID
+        self.__projects = projects
 
         super().__init__()
 
 
-    def run(self):
+    async def run(self):
         try:
-            resp = requests.get(f"{config.serverIP}/tags/{self.__tagID}/alloc_orders")
+            if self.__projects is None:
+                self.__projects = PagedList(api, f"/tags/{self.__tagID}/alloc_orders", AllocOrder)
 
-            if resp.status_code == 500:
+            status = await self.__projects.load()
+
+            if status in GATEWAY_ERRORS:
+                return "CONN_ERR"
+
+            if status >= 400 and status != 404:
                 return 500
-            
-            return resp.json()["data"]
 
-        except requests.exceptions.ConnectTimeout:
+            return self.__projects
+
+        except requests.Timeout:
             return "TIME_OUT"
         
-        except requests.ConnectionError:
+        except (requests.ConnectionError, CircuitOpenError):
             return "CONN_ERR"
     
 
     def on_event(self, e):
         if e == "TIME_OUT":
-            return BackToIdle(config.locale["REQ_TO"])
+            return BackToIdle(self.station, config.locale["REQ_TO"])
         
         if e == "CONN_ERR":
-            return BackToIdle(config.locale["SRV_UNREACH"])
+            return BackToIdle(self.station, config.locale["SRV_UNREACH"])
         
         if e == 500:
-            return BackToIdle(config.locale["SRV_INT"])
+            return BackToIdle(self.station, config.locale["SRV_INT"])
         
         if not e:
-            return BackToIdle(config.locale["NO_PROJ"])
+            return BackToIdle(self.station, config.locale["NO_PROJ"])
         
-        fname = e[0]["attributes"]["fname"]
-        lname = e[0]["attributes"]["lname"]
-
-        display_name = f"{fname[0]}. {lname}"[0:19]
+        display_name = e[0].display_name
 
-        if len(e) == 1:
-            return AcceptProject(e[0], self.__tagID, display_name)
+        if len(e) == 1 and e.complete:
+            return AcceptProject(self.station, e[0], self.__tagID, display_name)
         
-        return SelectProject(e, self.__tagID, display_name)
+        return SelectProject(self.station, e, self.__tagID, display_name)
 
 
 class AcceptProject(State):
@@ -274,61 +398,62 @@ class AcceptProject(State):
     """
 
 
-    def __init__(self, project, tagID, tagUser):
+    def __init__(self, station, project, tagID, tagUser):
         """
         Clears the display and prints the menu
 
         """
 
-        lcd.clear()
+        self.station = station
 
-        self.__project = project
+        self.station.lcd.clear()
 
-        project = project["attributes"]
-        proj_text = f"{project['order_name']} {project['op_name']}"[0: 16]
+        self.__project = project
 
-        lcd.Print([
+        self.station.lcd.Print([
             f"{tagUser: >20}",
-            f"&0& {proj_text} &1&",
+            f"&0& {project.display_text} &1&",
             "",
-            f"OK{config.locale['BACK']: >18}"
+            screens.ACCEPT_FOOTER
         ])
 
         self.__tagID = tagID
-        self.__last_states = [0, 0, 0] # Initial button states (not pressed) : left, middle, right
+
+        self.station.buttons.clear()     # Ignore presses made before the menu was shown
         
         super().__init__()
 
     
     def run(self):
-        left_pressed = not read(left_button)
-        middle_pressed = not read(middle_button)
-        right_pressed = not read(right_button)
+        pressed = self.station.buttons.next_press()
 
-        if left_pressed and left_pressed != self.__last_states[0]:
-            return self.__project
+        while pressed is not None:
+            if pressed == self.station.left_button:
+                return self.__project
 
-        if right_pressed and right_pressed != self.__last_states[2]:
-            return "CANCEL"
+            if pressed == self.station.right_button:
+                return "CANCEL"
 
-        self.__last_states[0] = left_pressed
-        self.__last_states[1] = middle_pressed
-        self.__last_states[2] = right_pressed
+            pressed = self.station.buttons.next_press()
         
         return "WAIT"
 
 
+    def waitables(self):
+        return [self.station.buttons]
+
+
     def on_event(self, e):
         if e == "TIME_OUT":
-            return BackToIdle("")
+            return BackToIdle(self.station, "")
         
         if e == "WAIT":
             return self
         
         if e == "CANCEL":
-            return BackToIdle(config.locale["CANCELED"])
+            return BackToIdle(self.station, config.locale["CANCELED"])
         
-        return Assign(e, self.__tagID)
+        return Assign(self.station, e, self.__tagID)
 
 
 class SelectProject(State):
@@ -346,107 +471,185 @@ class SelectProject(State):
     """
 
 
-    def __init__(self, projects, tagID, tagUser):
+    def __init__(self, station, projects, tagID, tagUser):
         """
         Clears display and prints the header and footer
-        
+
+        Parameters
+        ----------
+
+        projects : PagedList
+            Projects of the tag, the following pages are loaded while the user scrolls
+
         """
 
-        lcd.clear()
+        self.station = station
+
+        self.station.lcd.clear()
 
-        self.__projects_list = projects
+        self.__projects = projects
         self.__tagID = tagID
         self.__tagUser = tagUser
 
-        self.__projects_list.append({"id": -1, "attributes": {"order_name": config.locale["BACK"], "op_name": ""}})
-        self.__projects_list.extend(self.__projects_list)
-
-        self.__last_states = [0, 0, 0]  # Initial button states (not pressed) : left, middle, right
+        self.__back = AllocOrder(-1, config.locale["BACK"], "")
         self.__selected = 0
 
-        lcd.PrintLine(f"{self.__tagUser: >20}", 1)       # Header
-        # lcd.PrintLine("OK       &3&         &2&", 4)     # Footer
-        lcd.PrintLine("OK                 &2&", 4)     # Footer
+        self.station.lcd.PrintLine(f"{self.__tagUser: >20}", 1)       # Header
+        self.station.lcd.PrintLine(screens.SELECT_FOOTER, 4)          # Footer
+
+        self.station.buttons.clear()     # Ignore presses made before the menu was shown
 
         super().__init__()
 
-    
+
+    def __entry(self, index):
+        """
+        Entry of the menu: the projects followed by "Back", wrapping around once all the projects are loaded
+
+        Returns :
+            The entry, or None if its page is not loaded yet
+
+        """
+
+        projects = self.__projects
+
+        if projects.complete:
+            index %= len(projects) + 1
+
+        if index < len(projects):
+            return projects[index]
+
+        if projects.complete:
+            return self.__back
+
+        return None
+
+
+    async def __load_more(self):
+        """
+        Waits until the entry under the selected one is loaded, then handles the presses left queued
+
+        """
+
+        while True:
+            while self.__entry(self.__selected + 1) is None:
+                await self.__projects.load_more()
+
+            chosen = self.__handle_presses()
+
+            if chosen is not None:
+                return chosen
+
+            if self.__entry(self.__selected + 1) is not None:
+                return self.__draw()
+
+
     def run(self):
+        self.__projects.poll()
 
-        # Print two of the projects from the list
+        chosen = self.__handle_presses()
 
-        topProject = f"&0& { self.get_display_text( self.__projects_list[self.__selected]['attributes'] ) } &1&"
+        if chosen is not None:
+            return chosen
 
-        listToPrint = [
-            "",
-            f"{topProject:24}",
-            f"  {self.get_display_text(self.__projects_list[(self.__selected + 1)]['attributes']): <18}"
-        ]
+        if self.__entry(self.__selected + 1) is None:
+            return self.__load_more()
 
-        lcd.Print(listToPrint)
+        return self.__draw()
 
-        # Check for button action
 
-        left_pressed = not read(left_button)
-        # middle_pressed = not read(middle_button)
-        right_pressed = not read(right_button)
+    def __handle_presses(self):
+        """
+        Moves the selection for the queued presses
 
-        if left_pressed and left_pressed != self.__last_states[0]:
-            return self.__projects_list[self.__selected]
+        Returns :
+            The chosen entry, or None if nothing was chosen
 
-        # if middle_pressed and middle_pressed != self.__last_states[1]:
-        #     self.startTime = datetime.now()
-        #     self.__selected -= 1
+        """
 
-        #     if self.__selected < 0:
-        #         self.__selected = int(len(self.__projects_list) / 2) - 1
+        pressed = self.station.buttons.next_press()
 
-        if right_pressed and right_pressed != self.__last_states[2]:
-            self.startTime = datetime.now()
-            self.__selected += 1
+        while pressed is not None:
+            if pressed == self.station.left_button:
+                return self.__entry(self.__selected)
 
-            if self.__selected >= len(self.__projects_list) / 2:
-                self.__selected = 0
+            # if pressed == self.station.middle_button:
+            #     self.restart_timeout()
+            #     self.__selected -= 1
+
+            #     if self.__selected < 0:
+            #         self.__selected = len(self.__projects)
+
+            if pressed == self.station.right_button:
+                self.restart_timeout()
+                self.__selected += 1
+
+                if self.__projects.complete:
+                    self.__selected %= len(self.__projects) + 1
+
+                # Leave the other presses queued until the next entry is loaded
+
+                if self.__entry(self.__selected + 1) is None:
+                    break
+
+            pressed = self.station.buttons.next_press()
+
+        self.__projects.read_ahead(self.__selected + 1)
+
+        return None
+
+
+    def __draw(self):
+        """
+        Prints two of the projects from the list, the selected one on top
+
+        """
+
+        topProject = f"&0& { self.__entry(self.__selected).display_text } &1&"
+
+        listToPrint = [
+            "",
+            f"{topProject:24}",
+            f"  {self.__entry(self.__selected + 1).display_text: <18}"
+        ]
+
+        self.station.lcd.Print(listToPrint)
 
-        self.__last_states[0] = left_pressed
-        # self.__last_states[1] = middle_pressed
-        self.__last_states[2] = right_pressed
-        
         return "WAIT"
-    
 
-    def on_event(self, e):
-        if e == "TIME_OUT":
-            return BackToIdle("")
 
+    def waitables(self):
+        return [self.station.buttons]
+
+
+    def on_event(self, e):
         if e == "WAIT":
             return self
-        
-        if e['id'] == -1:
-            return BackToIdle(config.locale["CANCELED"])
-        
-        return Assign(e, self.__tagID)
-    
 
-    def get_display_text(self, project):
-        
-        text = project['order_name']
+        # The page read ahead is not needed anymore
+
+        self.__projects.cancel()
 
-        if project['op_name']:
-            text += " " + project['op_name']
+        if e == "TIME_OUT":
+            return BackToIdle(self.station, "")
 
-        return text[0: 16]
+        if e.id == -1:
+            return BackToIdle(self.station, config.locale["CANCELED"])
+
+        return Assign(self.station, e, self.__tagID)
 
 
 class Assign(State):
     """
-    Makes a call to the API to start a project
-    If the response is valid, returns BackToIdle with a confirmation message
+    Records the start of a project in the journal, which sends it to the API in the background
+    Only if the journal cannot be written, makes the call to the API directly
+    If the punch was recorded or the response is valid, returns BackToIdle with a confirmation message
 
     Events
     ==============
+        "QUEUED" : Punch recorded on disk in the journal
         "TIME_OUT" : Request timed out, returns BackToIdle with an error message
-        "CONN_ERR" : Connection error: server unreachable or error occurred during processing
+        "CONN_ERR" : Connection error: server unreachable or error occurred during processing, or server known to be down
 
     Status codes
     ==============
@@ -457,55 +660,53 @@ class Assign(State):
     """
     
     
-    def __init__(self, project, tagID):
-        self.__project = project['attributes']
+    def __init__(self, station, project, tagID):
+        self.station = station
+
+        self.__project = project
 
         self.__tagID = tagID
 
         super().__init__()
     
     
-    def run(self):
+    async def run(self):
+        req_data = self.__project.start_work()
+
         try:
-            req_data = {
-                "data": {
-                    "type": "timetracking",
-                    "attributes": {
-                        "hourly_rate": self.__project["hourlyrate"],
-                        "employee": int(self.__project["emplid"]),
-                        "operation": int(self.__project["op_id"]),
-                        "order": int(self.__project["order_id"]),
-                        "currency": self.__project["currency"]
-                    }
-                }
-            }
-            req_headers = {"Content-Type": "application/vnd.api+json"}
-
-            resp = requests.post(f"{config.serverIP}/timetracking", headers=req_headers, data=json.dumps(req_data), timeout=config.timeout)
+            await asyncio.wrap_future(journal.append("POST", "/timetracking", req_data))
+
+            return "QUEUED"
+
+        except OSError as e:
+            logging.warning("JOURNAL: " + str(e))
+
+        try:
+            resp = await asyncio.wrap_future(api.submit("POST", "/timetracking", req_data))
 
             if resp.status_code == 500:
                 return 500
 
-            return resp.json()['data']
+            return resp.status_code
 
-        except requests.exceptions.ConnectTimeout:
+        except requests.Timeout:
             return "TIME_OUT"
         
-        except requests.ConnectionError:
+        except (requests.ConnectionError, CircuitOpenError):
             return "CONN_ERR"
 
 
     def on_event(self, e):
         if e == "TIME_OUT":
-            return BackToIdle(config.locale["REQ_TO"])
+            return BackToIdle(self.station, config.locale["REQ_TO"])
         
         if e == "CONN_ERR":
-            return BackToIdle(config.locale["SRV_UNREACH"])
+            return BackToIdle(self.station, config.locale["SRV_UNREACH"])
         
         if e == 500:
-            return BackToIdle(config.locale["SRV_INT"])
+            return BackToIdle(self.station, config.locale["SRV_INT"])
         
-        return BackToIdle(config.locale["PROJ_A"])
+        return BackToIdle(self.station, config.locale["PROJ_A"])
 
 
 class EndWork(State):
@@ -523,67 +724,74 @@ class EndWork(State):
     """
 
 
-    def __init__(self, tagID, project, tagUser):
+    def __init__(self, station, tagID, entry, tagUser):
         """
         Clears the display and querys the user for confirmation
 
         """
 
-        proj_text = f"{project['attributes']['order_label']} {project['attributes']['operation_name']}"[0:17]
+        self.station = station
+
+        proj_text = f"{entry.order_label} {entry.operation_name}"[0:17]
 
-        lcd.clear()
-        lcd.Print([
+        self.station.lcd.clear()
+        self.station.lcd.Print([
             f"{tagUser: >20}",
             f"&0& {proj_text} &1&",
-            f"{config.locale['WORKING_SINCE']} {project['attributes']['worktime']}",
-            f"Stop{config.locale['BACK']: >16}"
+            f"{config.locale['WORKING_SINCE']} {entry.worktime}",
+            screens.END_WORK_FOOTER
         ])
 
-        self.__last_states = [0, 0, 0]  # Initial button states (not pressed) : left, middle, right
-
         self.__tagID = tagID
-        self.__jobID = project['id']
+        self.__entry = entry
+
+        self.station.buttons.clear()     # Ignore presses made before the menu was shown
 
         super().__init__()
     
 
     def run(self):
-        left_pressed = not read(left_button)
-        right_pressed = not read(right_button)
+        pressed = self.station.buttons.next_press()
 
-        if left_pressed and left_pressed != self.__last_states[0]:
-            return "OK"
+        while pressed is not None:
+            if pressed == self.station.left_button:
+                return "OK"
 
-        if right_pressed and right_pressed != self.__last_states[2]:
-            return "CANCEL"
+            if pressed == self.station.right_button:
+                return "CANCEL"
 
-        self.__last_states[0] = left_pressed
-        self.__last_states[2] = right_pressed
+            pressed = self.station.buttons.next_press()
         
         return "WAIT"
 
 
+    def waitables(self):
+        return [self.station.buttons]
+
+
     def on_event(self, e):
         if e == "TIME_OUT":
-            return BackToIdle("")
+            return BackToIdle(self.station, "")
         
         if e == "WAIT":
             return self
         
         if e == "CANCEL":
-            return BackToIdle(config.locale["CANCELED"])
+            return BackToIdle(self.station, config.locale["CANCELED"])
         
-        return Unassign(self.__tagID, self.__jobID)
+        return Unassign(self.station, self.__tagID, self.__entry)
 
 
 class Unassign(State):
     """
-    Makes a call to the API with an empty POST to stop the current running project.
+    Records the end of the current running project in the journal, which sends it to the API in the background.
+    Only if the journal cannot be written, makes the call to the API directly.
 
     Events
     ==============
+        "QUEUED" : Punch recorded on disk in the journal, return BackToIdle with a confirmation message
         "TIME_OUT" : Request timed out, return BackToIdle with an error message
-        "CONN_ERR" : Connection error: server unreachable or error occurred during processing
+        "CONN_ERR" : Connection error: server unreachable or error occurred during processing, or server known to be down
 
         Otherwise if the response status is ok, return BackToIdle with a confirmation message
 
@@ -595,30 +803,31 @@ class Unassign(State):
 
     """
 
-    def __init__(self, tagID, jobID):
-        lcd.clear()
-        lcd.PrintLine(f"{config.locale['PROC']:^20}", 2)
+    def __init__(self, station, tagID, entry):
+        self.station = station
+
+        self.station.lcd.clear()
+        self.station.lcd.Print(screens.PROCESSING)
 
         self.__tagID = tagID
-        self.__jobID = jobID
+        self.__entry = entry
 
         super().__init__()
 
 
-    def run(self):
+    async def run(self):
+        req_data = self.__entry.stop_work()
+
         try:
-            req_data = {
-                "data": {
-                    "id": self.__jobID,
-                    "type": "timetracking",
-                    "attributes": {
-                        "status": "f"
-                    }
-                }
-            }
-            req_headers = {"Content-Type": "application/vnd.api+json"}
-
-            resp = requests.patch(f"{config.serverIP}/timetracking/{self.__jobID}", headers=req_headers, data=json.dumps(req_data), timeout=config.timeout)
+            await asyncio.wrap_future(journal.append("PATCH", f"/timetracking/{self.__entry.id}", req_data))
+
+            return "QUEUED"
+
+        except OSError as e:
+            logging.warning("JOURNAL: " + str(e))
+
+        try:
+            resp = await asyncio.wrap_future(api.submit("PATCH", f"/timetracking/{self.__entry.id}", req_data))
 
             if resp.status_code == 500:
                 return 500
@@ -626,29 +835,29 @@ class Unassign(State):
             if resp.status_code == 404:
                 return 404
 
-            return resp.json()['data']
+            return resp.status_code
 
-        except requests.exceptions.ConnectTimeout:
+        except requests.Timeout:
             return "TIME_OUT"
         
-        except requests.ConnectionError:
+        except (requests.ConnectionError, CircuitOpenError):
             return "CONN_ERR"
 
 
     def on_event(self, e):
         if e == "TIME_OUT":
-            return BackToIdle(config.locale["REQ_TO"])
+            return BackToIdle(self.station, config.locale["REQ_TO"])
         
         if e == "CONN_ERR":
-            return BackToIdle(config.locale["SRV_UNREACH"])
+            return BackToIdle(self.station, config.locale["SRV_UNREACH"])
         
         if e == 500:
-            return BackToIdle(config.locale["SRV_INT"])
+            return BackToIdle(self.station, config.locale["SRV_INT"])
         
         if e == 404:
-            return BackToIdle(config.locale["INVALID_PROJ"])
+            return BackToIdle(self.station, config.locale["INVALID_PROJ"])
             
-        return BackToIdle(config.locale["PROJ_UA"])
+        return BackToIdle(self.station, config.locale["PROJ_UA"])
 
 
 class BackToIdle(State):
@@ -663,22 +872,21 @@ class BackToIdle(State):
     
     """
 
-    def __init__(self, msg):
+    def __init__(self, station, msg):
         """
         Clears display and prints the custom message
         
         """
 
+        self.station = station
+
         self.timeout = config.backToIdle_timeout
         
         if msg == "":
             self.timeout = 0
 
-        lcd.clear()
-
-        lines = msg.split("\n")
-        for i, line in enumerate(lines):
-            lcd.PrintLine(f"{line:^20}", 2 + i)
+        self.station.lcd.clear()
+        self.station.lcd.Print(screens.message(msg))
 
         super().__init__(self.timeout)
     
@@ -690,13 +898,13 @@ class BackToIdle(State):
 
     def on_event(self, e):
         if e == "TIME_OUT":
-            return Idle()
+            return Idle(self.station)
         
         return self
 
 
 # Create and configure the logger
 
-logging.basicConfig(filename="/root/Python/Spalek/log.txt")
+logging.basicConfig(filename = config.log_file, level = logging.INFO)
 logging.info("Program started")
 
@@ -1,26 +1,76 @@
+from time import perf_counter
+
+STARTED = perf_counter()
+
+import threading, importlib
+
+# Load the HTTP stack in the background while the hardware is initialised
+
+threading.Thread(target = importlib.import_module, args = ("requests",), daemon = True).start()
+
 from Spalek.machine import Idle
-from Spalek.__global_var import lcd
-from datetime import datetime
-import socket
-from time import sleep
+from Spalek.__global_var import stations, api, journal, allowlist, prober
+from Spalek.common.code import run_machine
+from Spalek.common.trace import tracer
+from Spalek.common import config
+from functools import partial
+import socket, asyncio, signal, logging
 
-if __name__ == "__main__":
 
-    hostname = socket.gethostname()
-    ip_addr = str(socket.gethostbyname(hostname))
-    
-    lcd.Print([hostname,"",ip_addr,""])
-    sleep(5)
+def warm_up(splash):
+    """
+    Fills in the IP address on the splash and prepares the API client, without delaying the first tap
 
-    state = Idle()
+    """
 
     try:
-        while True:
-            if (datetime.now() - state.startTime).seconds >= state.timeout_seconds:
-                state = state.on_event("TIME_OUT")
+        splash[1] = str(socket.gethostbyname(splash[0]))
+    except OSError:
+        splash[1] = ""
 
-            state = state.on_event(state.run())
-    except KeyboardInterrupt:
-        lcd.clear()
-        lcd.switchOff()
+    api.warm_up()
+
+
+async def main(splash):
+    loop = asyncio.get_event_loop()
+
+    # Dump the trace buffer on demand: kill -USR1 (JSON with statistics) or -USR2 (Chrome trace)
+
+    loop.add_signal_handler(signal.SIGUSR1, tracer.dump, config.trace_file)
+    loop.add_signal_handler(signal.SIGUSR2, tracer.dump, config.trace_file, True)
+
+    # One state machine per station, all run by this event loop
+
+    machines = [asyncio.ensure_future(run_machine(Idle(station, splash), partial(Idle, station))) for station in stations]
 
+    # The first pass of Idle publishes the scan screen, wait until it is on the displays;
+    # a display that does not answer does not hold up the start
+
+    await asyncio.sleep(0)
+
+    for station in stations:
+        await loop.run_in_executor(None, station.lcd.flush, 1)
+
+    tracer.record("startup", "startup", STARTED, perf_counter() - STARTED)
+    logging.info(f"Ready for tags {perf_counter() - STARTED:.3f} s after start")
+
+    await asyncio.gather(*machines)
+
+
+if __name__ == "__main__":
+
+    splash = [socket.gethostname(), ""]
+
+    threading.Thread(target = warm_up, args = (splash, ), daemon = True).start()
+
+    journal.start()     # Send the punches left over from the last run
+    allowlist.start()
+    prober.start()      # Keep a connection to the server warm between taps
+
+    try:
+        asyncio.run(main(splash))
+    except KeyboardInterrupt:
+        for station in stations:
+            station.lcd.clear()
+            station.lcd.switchOff()
+            station.lcd.flush(1)
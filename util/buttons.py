@@ -0,0 +1,144 @@
+"""
+This file holds the button input service
+
+"""
+
+
+from collections import deque, namedtuple
+from time import sleep, monotonic
+import threading, os
+
+from pyA20.gpio import gpio
+
+
+ButtonEvent = namedtuple("ButtonEvent", ["pin", "pressed"])
+
+
+class ButtonInput(object):
+    """
+    Samples the buttons in a background thread and queues debounced press/release events
+
+    A level change is reported only after the pin kept the new level for the whole
+    debounce time. The buttons are active low (pulled up, pressed = 0)
+
+    The object has a fileno() that becomes readable when events are queued,
+    so the state machine can wait on it together with the tag reader
+
+    """
+
+
+    def __init__(self, pins, sample_interval = .005, debounce = .02):
+        """
+        Parameters
+        ----------
+
+        pins : list
+            GPIO pins of the buttons
+
+        sample_interval : float
+            Seconds between two samples of the pins
+
+        debounce : float
+            Seconds a new level has to be stable before it is reported
+
+        """
+
+        self.pins = list(pins)
+        self.sample_interval = sample_interval
+        self.debounce = debounce
+
+        self.__events = deque()
+        self.__wake_r, self.__wake_w = os.pipe()
+        os.set_blocking(self.__wake_r, False)
+
+        self.__thread = None
+
+
+    def fileno(self):
+        return self.__wake_r
+
+
+    def start(self):
+        """
+        Starts sampling, the pins have to be configured as inputs first
+
+        """
+
+        if self.__thread is None:
+            self.__thread = threading.Thread(target = self.__sample, name = "buttons", daemon = True)
+            self.__thread.start()
+
+
+    def __sample(self):
+        levels = {pin: gpio.input(pin) for pin in self.pins}       # Debounced levels
+        changed = {pin: None for pin in self.pins}                  # When the raw level started to differ
+
+        while True:
+            now = monotonic()
+
+            for pin in self.pins:
+                level = gpio.input(pin)
+
+                if level == levels[pin]:
+                    changed[pin] = None
+                    continue
+
+                if changed[pin] is None:
+                    changed[pin] = now
+
+                elif now - changed[pin] >= self.debounce:
+                    levels[pin] = level
+                    changed[pin] = None
+
+                    self.__events.append(ButtonEvent(pin, not level))
+                    os.write(self.__wake_w, b"\0")
+
+            sleep(self.sample_interval)
+
+
+    def get(self):
+        """
+        Returns :
+            The oldest queued event, or None if there is none
+
+        """
+
+        try:
+            os.read(self.__wake_r, 64)
+        except BlockingIOError:
+            pass
+
+        try:
+            return self.__events.popleft()
+        except IndexError:
+            return None
+
+
+    def next_press(self):
+        """
+        Skips release events
+
+        Returns :
+            The pin of the oldest queued press, or None if there is none
+
+        """
+
+        e = self.get()
+
+        while e is not None:
+            if e.pressed:
+                return e.pin
+
+            e = self.get()
+
+        return None
+
+
+    def clear(self):
+        """
+        Drops the queued events, e.g. presses made before a menu was shown
+
+        """
+
+        while self.get() is not None:
+            pass
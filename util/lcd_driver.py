@@ -1,5 +1,12 @@
-from smbus import SMBus
 from time import sleep
+from functools import lru_cache
+
+try:
+    # smbus2 can send a whole frame in a single i2c_rdwr transfer
+    from smbus2 import SMBus, i2c_msg
+except ImportError:
+    from smbus import SMBus
+    i2c_msg = None
 
 LCD_CMD_MODE = 0
 LCD_DATA_MODE = 1
@@ -48,9 +55,52 @@ ENABLE_BIT = 0b00000100
 READ_WRITE = 0b00000010
 REGIST_SEL = 0b00000001
 
+# Bytes per SMBus block write: the command byte plus 32 data bytes
+I2C_BLOCK_SIZE = 33
+
+# Execution times of the slow commands, in seconds
+LCD_INIT_DELAY = .0045          # After each function set nibble of the power-on sequence
+LCD_CLEAR_DELAY = .002
+
 # Line addresses
 LCD_LINES = [0x80, 0xC0, 0x94, 0xD4]
 
+LCD_COLUMNS = 20
+LCD_BLANK = ord(' ')
+LCD_UNKNOWN = 0x100         # Shadow value of a cell whose contents are unknown, never equal to a character
+
+
+@lru_cache(maxsize = 256)
+def compile_line(text):
+    """
+    Converts a line of text to the character codes sent to the display, clipped to the line width
+
+    "&N&" is replaced by the custom character N and "&&" by a single '&'.
+    Results are cached, so lines that are drawn again are not parsed again
+
+    """
+
+    codes = []
+
+    i = 0
+    while i < len(text):
+        c = ord(text[i])
+
+        if text[i] == '&':
+            if text[i + 1] != '&':
+                i += 1
+                code_fin = text[i: ].find('&')
+
+                c = int(text[i: i + code_fin])
+                i = i + code_fin
+            else:
+                i += 1
+        
+        codes.append(c & 0xFF)
+        i += 1
+
+    return bytes(codes[0: LCD_COLUMNS])
+
 
 class LCD_Driver:
     """
@@ -58,65 +108,111 @@ class LCD_Driver:
 
     """
 
-    def __init__(self):
+    def __init__(self, addr = 0x27, bus = 0):
         """
         Initializes the LCD module and sends start-up instructions:
 
-        - Clear display * 3
-        - Return home
+        - Function set (8 bit) * 3, then function set (4 bit), as single nibbles
         - Set entry mode
         - Switch display on
         - Set display parameters
         - Clear display
 
+        The driver keeps a shadow copy of the display contents, so printing
+        only sends the characters that differ from what is already shown
+
+        Writes are queued and flushed to the PCF8574 backpack in as few I2C
+        transfers as possible; the bus clock is slow enough to satisfy the
+        HD44780 enable pulse timing, so no sleeps are needed between bytes
+
+        Parameters
+        ----------
+
+        addr : int
+            I2C address of the backpack, displays sharing a bus need different ones
+
+        bus : int
+            Number of the I2C bus
+
         """
 
-        self.addr = 0x27
-        self.bus = SMBus(0)
+        self.addr = addr
+        self.bus = SMBus(bus)
 
         self.__backlight = LCD_BACKLIGHT_ON
 
-        self.__send(0x33)
-        self.__send(0x32)
+        self.__shadow = [[LCD_BLANK] * LCD_COLUMNS for _ in LCD_LINES]
+        self.__cursor = (0, 0)      # (line, column) of the DDRAM address counter, None if unknown
+        self.__buffer = bytearray()  # Pending PCF8574 output states
+
+        # Whatever mode a power blip left the controller in, three 8 bit function sets
+        # resynchronise it; each needs up to 4.1 ms, so they go out one nibble at a time
+
+        for nibble in (0x30, 0x30, 0x30, 0x20):
+            self.__send_4_bits(LCD_CMD_MODE | nibble)
+            self.__flush()
+            sleep(LCD_INIT_DELAY)
+
         self.__send(LCD_ENTRY_MODE | ENTRY_MODE_RIGHT)
         self.__send(LCD_DISPLAY_CTRL | DISPLAY_CTRL_ON)
         self.__send(LCD_FUNCTION_SET | FUNCTION_SET_2LINE | FUNCTION_SET_4BIT | FUNCTION_SET_5x8_DOTS)
-        self.__send(LCD_CLEAR_DISPLAY)
-
-        sleep(.0005)
+        self.__send(LCD_CLEAR_DISPLAY, delay = LCD_CLEAR_DELAY)
     
 
-    def __write_to_bus(self, data):
+    def __flush(self):
         """
-        Write data to SPI bus, then wait
+        Write the queued output states to the I2C bus
 
-        """
+        With smbus2 the whole queue goes out in one transfer, otherwise it is
+        split in SMBus block writes, the first byte of each being sent as the command
 
-        self.bus.write_byte(self.addr, data)
-        sleep(.0001)
+        If the transfer fails, the queue is dropped and the whole shadow copy is marked
+        unknown, since any part of it may have been applied: the next Print redraws every cell
 
+        Raises :
+            OSError if the transfer fails
 
-    def __latch(self, data):
         """
-        Execute a latch operation
 
-        """
+        if not self.__buffer:
+            return
 
-        self.__write_to_bus( data | ENABLE_BIT )
-        sleep(.0005)
+        try:
+            if i2c_msg is not None:
+                self.bus.i2c_rdwr(i2c_msg.write(self.addr, self.__buffer))
+            else:
+                for i in range(0, len(self.__buffer), I2C_BLOCK_SIZE):
+                    block = self.__buffer[i: i + I2C_BLOCK_SIZE]
+
+                    if len(block) == 1:
+                        self.bus.write_byte(self.addr, block[0])
+                    else:
+                        self.bus.write_i2c_block_data(self.addr, block[0], list(block[1: ]))
+
+        except Exception:
+            self.__shadow = [[LCD_UNKNOWN] * LCD_COLUMNS for _ in LCD_LINES]
+            self.__cursor = None
+
+            raise
+
+        finally:
+            self.__buffer = bytearray()
 
-        self.__write_to_bus( data & ~ENABLE_BIT )
-        sleep(.0005)
-    
 
     def __send_4_bits(self, data):
-        self.__write_to_bus(data | self.__backlight)
-        self.__latch(data | self.__backlight)
+        """
+        Queue a nibble: set up the data, raise enable, then drop it to latch
+
+        """
+
+        data |= self.__backlight
+
+        self.__buffer += bytes((data, data | ENABLE_BIT, data & ~ENABLE_BIT))
     
 
-    def __send(self, data, mode = LCD_CMD_MODE):
+    def __send(self, data, mode = LCD_CMD_MODE, delay = 0):
         """
-        Sends 8 bits of data, the first 4 then the last 4
+        Queues 8 bits of data, the first 4 then the last 4
 
         Parameters
         ----------
@@ -127,64 +223,118 @@ class LCD_Driver:
         mode : LCD_CMD_MODE / LCD_DATA_MODE:
             mode = LCD_CMD_MODE => data is a command
             mode = LCD_DATA_MODE => data is to be displayed
+
+        delay : float
+            seconds the command needs to execute; the queue is flushed and
+            the driver waits before anything else is sent
         
         """
 
         self.__send_4_bits(mode | (data & 0xF0))
         self.__send_4_bits(mode | ((data << 4) & 0xF0))
 
+        if delay:
+            self.__flush()
+            sleep(delay)
+
 
     def switchOn(self):
         self.__backlight = LCD_BACKLIGHT_ON
 
         self.__send(0)
+        self.__flush()
 
 
     def switchOff(self):
         self.__backlight = LCD_BACKLIGHT_OFF
 
         self.__send(0)
+        self.__flush()
 
     
     def clear(self):
-        self.__send(LCD_CLEAR_DISPLAY)
-        self.__send(LCD_RETURN_HOME)
+        if self.__cursor == (0, 0) and all(c == LCD_BLANK for row in self.__shadow for c in row):
+            return
+
+        self.__send(LCD_CLEAR_DISPLAY, delay = LCD_CLEAR_DELAY)
+        self.__send(LCD_RETURN_HOME, delay = LCD_CLEAR_DELAY)
+
+        self.__shadow = [[LCD_BLANK] * LCD_COLUMNS for _ in LCD_LINES]
+        self.__cursor = (0, 0)
+
+
+    def __queue_line(self, text, line):
+        """
+        Queues the cells of a line that differ from the shadow copy,
+        the cursor is moved only when the next changed cell is not the current address
+
+        text is either a string or a line already compiled with compile_line
+
+        """
+
+        if not isinstance(text, bytes):
+            text = compile_line(text)
+
+        row = self.__shadow[line - 1]
+
+        for col, c in enumerate(text):
+            if row[col] == c:
+                continue
+
+            if self.__cursor != (line - 1, col):
+                self.__send(LCD_LINES[line - 1] + col)
+
+            self.__send(c, LCD_DATA_MODE)
+
+            row[col] = c
+            self.__cursor = (line - 1, col + 1) if col + 1 < LCD_COLUMNS else None
 
 
     def PrintLine(self, text, line = 1):
+        """
+        Prints text starting from the first column of a line
+
+        """
+
         if line > 4:
             return False
-        
-        self.__send(LCD_LINES[line - 1])
-
-        i = 0
-        while i < len(text):
-            c = ord(text[i])
-
-            if text[i] == '&':
-                if text[i + 1] != '&':
-                    i += 1
-                    code_fin = text[i: ].find('&')
-
-                    c = int(text[i: i + code_fin])
-                    i = i + code_fin
-                else:
-                    i += 2
-            
-            self.__send(c, LCD_DATA_MODE)
-            i += 1
+
+        self.__queue_line(text, line)
+        self.__flush()
     
 
     def Print(self, lines):
-        for line_nr, line_text in enumerate(lines):
-            self.PrintLine(line_text, line_nr + 1)
+        """
+        Prints up to four lines, sending the whole screen in one batch
+
+        """
+
+        for line_nr, line_text in enumerate(lines[0: len(LCD_LINES)]):
+            self.__queue_line(line_text, line_nr + 1)
+
+        self.__flush()
+
+
+    def contents(self):
+        """
+        Returns :
+            The text shown on the display, as tracked by the shadow copy.
+            Custom characters are returned as the characters with codes 0 - 7,
+            cells left unknown by a failed transfer as '?'
+
+        """
+
+        return ["".join(chr(c) if c != LCD_UNKNOWN else "?" for c in row) for row in self.__shadow]
 
 
     def LoadCustom(self, font_data):
         self.__send(LCD_SET_CGRAM)
+        self.__cursor = None
 
         for line in font_data:
             for el in line:
                 self.__send(el, LCD_DATA_MODE)
 
+        self.__flush()
+
 
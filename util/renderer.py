@@ -0,0 +1,178 @@
+"""
+This file holds the thread that draws on the LCD, so the state machine never waits on the I2C bus
+
+"""
+
+
+import threading, logging
+
+from Spalek.util.lcd_driver import compile_line, LCD_LINES, LCD_COLUMNS, LCD_BLANK
+from Spalek.common.trace import tracer
+
+
+BLANK_LINE = bytes([LCD_BLANK]) * LCD_COLUMNS
+
+
+class LCD_Renderer:
+    """
+    Frame queue in front of an LCD_Driver
+
+    It has the same drawing methods as the driver, but they only update the desired
+    frame in memory and return. A background thread draws the newest frame, so
+    intermediate frames published while the bus is busy are never drawn
+
+    A frame whose transfer fails (e.g. a glitch of the I2C backpack) is logged and
+    drawn again after RETRY_DELAY seconds, or as soon as a newer frame is published
+
+    """
+
+    RETRY_DELAY = 1
+
+    def __init__(self, driver):
+        """
+        Parameters
+        ----------
+
+        driver : LCD_Driver
+            Driver used by the render thread, nothing else should write to it
+
+        """
+
+        self.__driver = driver
+        self.__bus = threading.Lock()       # Held while the driver is in use
+        self.__cond = threading.Condition()
+
+        self.__frame = [BLANK_LINE] * len(LCD_LINES)
+        self.__backlight = True
+        self.__version = 0              # Incremented on every change of the desired frame
+        self.__drawn_version = 0
+
+        self.__driver.clear()
+
+        self.__thread = threading.Thread(target = self.__render, name = "lcd", daemon = True)
+        self.__thread.start()
+
+
+    def __publish(self):
+        self.__version += 1
+        self.__cond.notify_all()
+
+
+    def __render(self):
+        backlight = True        # State of the backlight on the display
+
+        while True:
+            with self.__cond:
+                while self.__drawn_version == self.__version:
+                    self.__cond.wait()
+
+                frame = list(self.__frame)
+                version = self.__version
+                wanted = self.__backlight
+
+            # The driver only sends the cells that changed since the last frame,
+            # or every cell after a failed transfer
+
+            try:
+                with self.__bus, tracer.span("lcd.draw", "lcd"):
+                    self.__driver.Print(frame)
+
+                    if wanted != backlight:
+                        if wanted:
+                            self.__driver.switchOn()
+                        else:
+                            self.__driver.switchOff()
+
+            except OSError as e:
+                logging.warning("LCD: " + str(e))
+
+                with self.__cond:
+                    self.__cond.wait(self.RETRY_DELAY)
+
+                continue
+
+            backlight = wanted
+
+            with self.__cond:
+                self.__drawn_version = version
+                self.__cond.notify_all()
+
+
+    def flush(self, timeout = None):
+        """
+        Waits until the newest frame was drawn
+
+        Returns :
+            False if the timeout expired first
+
+        """
+
+        with self.__cond:
+            return self.__cond.wait_for(lambda: self.__drawn_version == self.__version, timeout)
+
+
+    def switchOn(self):
+        with self.__cond:
+            self.__backlight = True
+            self.__publish()
+
+
+    def switchOff(self):
+        with self.__cond:
+            self.__backlight = False
+            self.__publish()
+
+
+    def clear(self):
+        with self.__cond:
+            self.__frame = [BLANK_LINE] * len(LCD_LINES)
+            self.__publish()
+
+
+    def PrintLine(self, text, line = 1):
+        """
+        Overwrites the start of a line in the desired frame, like LCD_Driver.PrintLine
+
+        """
+
+        if line > 4:
+            return False
+
+        if not isinstance(text, bytes):
+            text = compile_line(text)
+
+        with self.__cond:
+            self.__frame[line - 1] = text + self.__frame[line - 1][len(text): ]
+            self.__publish()
+
+
+    def Print(self, lines):
+        with self.__cond:
+            for line_nr, text in enumerate(lines[0: len(LCD_LINES)]):
+                if not isinstance(text, bytes):
+                    text = compile_line(text)
+
+                self.__frame[line_nr] = text + self.__frame[line_nr][len(text): ]
+
+            self.__publish()
+
+
+    def contents(self):
+        """
+        Returns :
+            The text drawn on the display, see LCD_Driver.contents
+
+        """
+
+        with self.__bus:
+            return self.__driver.contents()
+
+
+    def LoadCustom(self, font_data):
+        """
+        Loads custom characters, between two frames
+
+        """
+
+        with self.__bus:
+            self.__driver.LoadCustom(font_data)
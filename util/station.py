@@ -0,0 +1,79 @@
+"""
+This file holds the hardware of a station: a tag reader, an LCD and three buttons
+
+"""
+
+
+from pyA20.gpio import gpio
+
+from Spalek.util.lcd_driver import LCD_Driver
+from Spalek.util.renderer import LCD_Renderer
+from Spalek.util.buttons import ButtonInput
+from Spalek.util.tag_reader import RDM6300
+from Spalek.common import config
+
+
+class Station(object):
+    """
+    Hardware bindings of one station, passed to every state of its state machine
+
+    Several stations can be served by the same board: each one has its own serial
+    port, LCD address and button pins, and its state machine runs as a task of the
+    common event loop
+
+    ...
+    Attributes
+    ----------
+    name : string
+        Shown in the logs and traces
+
+    serial_port : string
+        Serial port of the RDM6300 reader
+
+    reader : RDM6300
+        Reader of the station, open and parsing frames from start() on, so a card held
+        on it is recognised whatever state the station is in
+
+    lcd : LCD_Renderer
+        Display of the station
+
+    buttons : ButtonInput
+        Debounced events of the station's buttons
+
+    left_button, middle_button, right_button : pins
+        GPIO pins of the buttons
+
+    """
+
+
+    def __init__(self, name, serial_port, lcd_address, left_button, middle_button, right_button):
+        self.name = name
+        self.serial_port = serial_port
+
+        self.left_button = left_button
+        self.middle_button = middle_button
+        self.right_button = right_button
+
+        self.reader = None
+        self.lcd = LCD_Renderer(LCD_Driver(lcd_address))
+        self.buttons = ButtonInput([left_button, middle_button, right_button], config.button_sample_interval, config.button_debounce)
+
+
+    def start(self, font):
+        """
+        Configures the button pins, starts sampling them, opens the reader and loads the custom characters
+
+        gpio.init() has to be called first
+
+        """
+
+        for pin in self.buttons.pins:
+            gpio.setcfg(pin, gpio.INPUT)
+            gpio.pullup(pin, gpio.PULLUP)
+
+        self.buttons.start()
+
+        self.reader = RDM6300(self.serial_port, 9600)
+        self.reader.start()
+
+        self.lcd.LoadCustom(font)
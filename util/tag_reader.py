@@ -1,11 +1,19 @@
+from collections import deque
+from time import monotonic, sleep
+import threading, os, logging
 import serial
-import struct
+
+from Spalek.common import config
 
 
 class RDM6300(object):
     """
     A class that implements tag reading for the RDM6300 module
 
+    The reader stays open for the whole life of its station: once started, a background
+    thread parses the frames as they arrive, whatever state the station is in, so the
+    frames repeated by a card held on the module are recognised even across a menu
+
     ...
     Attributes
     ----------
@@ -15,6 +23,9 @@ class RDM6300(object):
     END_CODE : hex byte
         The code each tag ends with
 
+    FRAME_SIZE : int
+        Length of a frame: start code, 10 hex data digits, 2 hex checksum digits, end code
+
     __rfid_reader : serial object
         An object that deals with communication between Orange Pi and the RDM6300 module
         using the serial protocol
@@ -22,10 +33,20 @@ class RDM6300(object):
     __raw_tag_data : string
         A string containing the raw data on the read tag
     
+    __buffer : bytearray
+        Bytes received from the module that were not yet parsed
+
+    __tags : deque
+        (raw tag, data) of the tags read and not yet taken by done()
+
+    __last : tuple
+        (raw tag, monotonic() time) of the last frame parsed
+
     """
 
     START_CODE = 0x02
     END_CODE = 0x03
+    FRAME_SIZE = 14
     
     __rfid_reader = None
     __raw_tag_data = None
@@ -44,6 +65,17 @@ class RDM6300(object):
         
         """
 
+        self.__buffer = bytearray()
+        self.__tag = None
+        self.__tags = deque()
+        self.__last = None
+        self.__thread = None
+
+        # Written to when a tag is read, so the reader can be waited on with select()
+
+        self.__wake_r, self.__wake_w = os.pipe()
+        os.set_blocking(self.__wake_r, False)
+
         self.__rfid_reader = serial.Serial(port = serial_port, baudrate = baudRate, bytesize = serial.EIGHTBITS, timeout = 1)
 
 
@@ -57,104 +89,154 @@ class RDM6300(object):
             self.__rfid_reader.close()
 
 
-    def __clear(self):
-        while self.__rfid_reader.in_waiting:
-            self.__rfid_reader.read()
+    def fileno(self):
+        """
+        File descriptor that becomes readable when a tag is read, so the reader can be waited on with select()
+
+        """
 
+        return self.__wake_r
 
-    def __read(self):
+
+    def start(self):
         """
-        Reads data from the serial port and tries to decode a tag
+        Starts reading the serial port in the background
 
-        Returns :
-            True if the opperation was successful or false otherwise
+        """
 
-        Raises :
-            Exception if any error occurs
-        
+        if self.__thread is None:
+            self.__thread = threading.Thread(target = self.__receive, name = "reader " + self.__rfid_reader.port, daemon = True)
+            self.__thread.start()
+
+
+    def __receive(self):
+        while True:
+            try:
+                # Block until the first byte (or the port timeout), then take all the waiting ones in one call
+
+                data = self.__rfid_reader.read(1)
+
+                if not data:
+                    continue
+
+                waiting = self.__rfid_reader.in_waiting
+
+                if waiting:
+                    data += self.__rfid_reader.read(waiting)
+
+            except (serial.SerialException, OSError) as e:
+                logging.warning("TAG_READER: " + str(e))
+                sleep(1)
+
+                continue
+
+            self.__buffer += data
+
+            while self.__parse():
+                os.write(self.__wake_w, b"\0")
+
+
+    def __parse(self):
         """
+        Tries to decode a tag from the bytes received so far
+
+        Bytes before a start code and frames with an invalid stop byte, data or checksum
+        are discarded, so the parser resyncs on the next start code
+
+        The module repeats the frame for as long as a card is held on it: a frame with the
+        tag of the last one parsed less than config.tag_repeat_window seconds earlier is
+        dropped too, and extends the window
 
-        self.__raw_data = None
+        Returns :
+            True if a tag was queued or False if more data is needed
         
-        tag = ''
-        calculated_checksum = 0
-        receivedData = []
-        data_fragment = []
-        index = 0
-	
+        """
+
         while True:
-            if self.__rfid_reader.in_waiting:
-                data_fragment = self.__rfid_reader.read()
-
-                if len(data_fragment) != 0:
-                    if index == 0 or index == 13:
-                        data_fragment = struct.unpack('@B', data_fragment)[0]
-                    else:
-                        tag += str(struct.unpack('@B', data_fragment)[0])
-
-                        data_fragment = int(data_fragment, 16)
-
-                    receivedData.append(data_fragment)
-                    index += 1
-                
-                if index == 14:
-                    if (receivedData[0] != self.START_CODE) or (receivedData[13] != self.END_CODE):
-                        raise Exception('Invalid start/stop bytes!')
-
-                    for i in range(1, 11, 2):
-                        byte = (receivedData[i] << 4) | (receivedData[i + 1])
-
-                        calculated_checksum ^= byte
-                    
-                    received_checksum = (receivedData[11] << 4) | receivedData[12]
-
-                    if calculated_checksum != received_checksum:
-                        raise Exception('Invalid checksum!')
-
-                    self.__raw_tag_data = tag
-                    self.__tag = receivedData
-		    
-                    return True
-            else:
-                yield False
-        
-        return False
+            start = self.__buffer.find(self.START_CODE)
+
+            if start < 0:
+                del self.__buffer[:]
+                return False
+
+            del self.__buffer[:start]
+
+            if len(self.__buffer) < self.FRAME_SIZE:
+                return False
+
+            frame = self.__buffer[0: self.FRAME_SIZE]
+
+            # Drop the start code, so a bad frame is skipped when resyncing
+
+            del self.__buffer[:1]
+
+            if frame[13] != self.END_CODE:
+                continue
+
+            try:
+                data = bytes.fromhex(frame[1: 13].decode('ascii'))
+            except ValueError:
+                continue
+
+            if data[0] ^ data[1] ^ data[2] ^ data[3] ^ data[4] != data[5]:
+                continue
+
+            del self.__buffer[:self.FRAME_SIZE - 1]
+
+            raw = frame[1: 13].decode('ascii')
+            now = monotonic()
+            last = self.__last
+
+            self.__last = (raw, now)
+
+            if last is not None and last[0] == raw and now - last[1] < config.tag_repeat_window:
+                continue
+
+            self.__tags.append((raw, data))
+
+            return True
     
 
     def readTag(self):
         """
-        Keeps reading data until a valid tag is received
-
-        Returns :
-            True when the data has been successfully read or False if a KeyboardInterrupt canceled the operation
+        Starts waiting for a new tag, discarding the tags read so far
         
         """
 
-        self.__read_gen = self.__read()
         self.reset()
 
     
     def done(self):
+        """
+        Returns :
+            True once a tag was read since readTag()
+
+        """
+
         if self.__raw_tag_data != None:
             return True
 
         try:
-            if next(self.__read_gen) != True:
-                return False
-        
-        except StopIteration as e:
-            if e.value == True:
-                return True
-            
-            self.readTag()
-        
-        return False
+            os.read(self.__wake_r, 64)
+        except BlockingIOError:
+            pass
+
+        try:
+            self.__raw_tag_data, self.__tag = self.__tags.popleft()
+        except IndexError:
+            return False
+
+        return True
     
 
     def reset(self):
-        self.__clear()
+        try:
+            os.read(self.__wake_r, 64)
+        except BlockingIOError:
+            pass
+
+        self.__tags.clear()
         self.__raw_tag_data = None
-        self.__raw_data = None
 
 
     @property
@@ -197,7 +279,6 @@ class RDM6300(object):
         """
 
         if self.__tag != None:
-            return "000" + str(int(''.join([hex(l)[2:] for l in self.__tag[5: 11]]), 16))
+            return "000" + str(int.from_bytes(self.__tag[2: 5], 'big'))
 
         return None
-